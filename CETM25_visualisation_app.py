@@ -1,227 +1,269 @@
-import pandas as pd
-import plotly_express as px
+import json
+import functools
+import logging
+import os
+import threading
+
 import dash
 from dash import (
+    callback_context,
     dcc,
     html,
 )
 from dash.dependencies import (
+    ClientsideFunction,
     Input,
     Output,
+    State,
 )
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-
-df_raw = pd.read_csv(
-    'https://raw.githubusercontent.com/GiselleVicatos/Sunderland_CETM25/main/country%20vaccinations.csv'
+import flask
+
+import figures
+import http_cache
+import metrics
+import precompute
+from caching import (
+    DiskCache,
+    LRUCache,
+    cache_from_url,
+    cached_callback,
+)
+from dashboard_config import load_config
+from geometry import GeometryAssets
+from http_cache import (
+    IMMUTABLE_MAX_AGE,
+    CompressedPayload,
+)
+from startup import Warmup
+from state import (
+    DashboardState,
+    Refresher,
+    StateHolder,
 )
 
-# CLEAN DATA
+logger = logging.getLogger(__name__)
 
-# Select only relevant columns
+# The data pipeline's modules (data_source, dataset, derived, downsample, shared_dataset), and pandas
+# and numpy with them, are imported where they are used, so that a background warm-up's server answers
+# /healthz without waiting for them.
 
-cols = [
-    'country',
-    'iso_code',
-    'date',
-    'people_fully_vaccinated',
-]
-df = df_raw[cols]
+# Text-only callbacks and the line graph range change run in the browser unless this is set to 0
+CLIENTSIDE_CALLBACKS = os.environ.get('CETM25_CLIENTSIDE', '1') != '0'
 
-# Replace null values with value in previous row, but grouped by country
-df['people_fully_vaccinated'] = df.groupby(['country'])['people_fully_vaccinated'].ffill()
+# Send the choropleth animation frames after the first page load rather than inside the layout
+LAZY_MAP_FRAMES = os.environ.get('CETM25_LAZY_MAP_FRAMES', '1') != '0'
 
-# Select specific dates in the month over a 3 month period
-df_final = df.loc[
-    df['date'].isin(
-        [
-            '2021-01-15',
-            '2021-02-01',
-            '2021-02-15',
-            '2021-03-01',
-            '2021-03-15',
-            '2021-04-01',
-            '2021-04-15',
-        ]
-    )
-]
+# Attach to the dataset published in shared memory by serve.py --shared-memory (or shared_dataset.py)
+SHARED_MEMORY = os.environ.get('CETM25_SHARED_MEMORY', '0') != '0'
 
-# Need to pivot dataframe so that each date is a column reading
-df_pivot = df_final.pivot(
-    index=['iso_code', 'country'],
-    columns='date',
-    values='people_fully_vaccinated',
-)
-df_pivot.reset_index(level=0, inplace=True)
-df_pivot.reset_index(level=0, inplace=True)
-df_pivot = df_pivot.rename_axis(None, axis=1)
-
-Africa = [
-    'Algeria', 'Angola', 'Benin', 'Botswana', 'Burkina Faso', 'Cameroon', 'Cape Verde', 'Central African Republic',
-    'Chad', 'Comoros', 'Congo', "Cote d'Ivoire", 'Democratic Republic of the Congo', 'Djibouti', 'Egypt',
-    'Equatorial Guinea', 'Eswatini', 'Ethiopia', 'Gabon', 'Gambia', 'Ghana', 'Guinea', 'Guinea-Bissau', 'Kenya',
-    'Lesotho', 'Libya', 'Liberia', 'Madagascar', 'Malawi', 'Mali', 'Mauritania', 'Mauritius', 'Morocco', 'Mozambique',
-    'Namibia', 'Niger', 'Nigeria', 'Rwanda', 'Saint Helena', 'Sao Tome and Principe', 'Senegal', 'Seychelles',
-    'Sierra Leone', 'Somalia', 'South Africa', 'Sudan', 'Togo', 'Tunisia', 'Uganda', 'Zambia', 'Zimbabwe'
-]
+# Seconds between background data refreshes, 0 disables them. With shared memory this is how often
+# the published version is checked.
+REFRESH_INTERVAL = float(os.environ.get('CETM25_REFRESH_INTERVAL', '5' if SHARED_MEMORY else '0'))
 
-Europe = [
-    'Andorra', 'Albania', 'Austria', 'Azerbaijan', 'Belarus', 'Belgium', 'Bosnia and Herzegovina', 'Bulgaria',
-    'Croatia', 'Cyprus', 'Czechia', 'Denmark', 'Estonia', 'Faeroe Islands', 'Finland', 'France', 'Georgia', 'Germany',
-    'Gibraltar', 'Greece', 'Guernsey', 'Hungary', 'Iceland', 'Ireland', 'Isle of Man', 'Italy', 'Jersey', 'Kosovo',
-    'Latvia', 'Liechtenstein', 'Lithuania', 'Luxembourg', 'Malta', 'Moldova', 'Monaco', 'Montenegro', 'Netherlands',
-    'North Macedonia', 'Northern Cyprus', 'Norway', 'Poland', 'Portugal', 'Romania', 'San Marino', 'Serbia', 'Slovakia',
-    'Slovenia', 'Spain', 'Sweden', 'Switzerland', 'Turkey', 'Ukraine', 'United Kingdom',
-]
+# Read the CSV this many rows at a time, so memory does not grow with its size. 0 reads it whole,
+# through the local snapshot.
+CHUNKSIZE = int(os.environ.get('CETM25_CHUNKSIZE', '0'))
+
+# 'full' reloads the source from scratch, 'incremental' only appends rows newer than the loaded data
+REFRESH_MODE = os.environ.get('CETM25_REFRESH_MODE', 'full')
+
+# Callback results cache shared by the workers: 'memory', 'disk:<directory>' or 'redis://host:port/db'
+CALLBACK_CACHE = os.environ.get('CETM25_CALLBACK_CACHE', 'memory')
+CALLBACK_CACHE_TTL = float(os.environ.get('CETM25_CALLBACK_CACHE_TTL', '3600'))
+
+# 'grid' plots the configured dates. 'daily' plots every day, downsampled to about LINE_POINTS points per
+# region for whichever range is visible, and redrawn on zoom and pan.
+LINE_MODE = os.environ.get('CETM25_LINE_MODE', 'grid')
+LINE_POINTS = int(os.environ.get('CETM25_LINE_POINTS', '800'))
+# 'lttb' or 'minmax', see downsample.py
+DOWNSAMPLE = os.environ.get('CETM25_DOWNSAMPLE', 'lttb')
+# Draw the daily lines with WebGL (scattergl)
+LINE_WEBGL = os.environ.get('CETM25_LINE_WEBGL', '0') != '0'
 
-# Dataframe with only African countries
-df_africa = df_pivot[df_pivot['country'].isin(Africa)]
+# Draw the map with the country shapes built by geometry.py, when they have been built
+MAP_GEOMETRY = os.environ.get('CETM25_MAP_GEOMETRY', '1') != '0'
 
-# Dataframe with only European countries
-df_europe = df_pivot[df_pivot['country'].isin(Europe)]
+# 'blocking' loads the data and builds the figures while the module is imported. 'background' does it
+# in a thread, so the server answers /healthz and /ready (and serves a loading page) straight away.
+WARMUP = os.environ.get('CETM25_WARMUP', 'blocking')
+
+# Keep the prebuilt figures on disk by data version, so a restart on the same data skips building them
+FIGURE_STORE = os.environ.get('CETM25_FIGURE_STORE', '1') != '0'
+
+# Callback responses at least this long are compressed, and kept compressed for repeat responses
+COMPRESS_MIN_BYTES = int(os.environ.get('CETM25_COMPRESS_MIN_BYTES', '1024'))
+
+# CLEAN DATA
+
+# The date grid and regions come from dashboard_config, and are built in one pass per snapshot.
+# The snapshot itself is not kept, only what was derived from it.
+config = load_config()
+
+# Country shapes at several levels of detail, or None to use Plotly's world geometry
+geometry = GeometryAssets.load() if MAP_GEOMETRY else None
+map_geojson = geometry.initial_url if geometry is not None else None
 
 # LINE GRAPH
 
-# Line graph needs a sum of vaccinations for selected time periods
-# Create new dataframe containing summations
-date_data = {
-    'Date': [
-        '2021-01-15',
-        '2021-02-01',
-        '2021-02-15',
-        '2021-03-01',
-        '2021-03-15',
-        '2021-04-01',
-        '2021-04-15',
-        '2021-01-15',
-        '2021-02-01',
-        '2021-02-15',
-        '2021-03-01',
-        '2021-03-15',
-        '2021-04-01',
-        '2021-04-15',
-    ],
-    'Continent': [
-        'Africa', 'Africa', 'Africa', 'Africa', 'Africa', 'Africa', 'Africa', 'Europe', 'Europe', 'Europe', 'Europe',
-        'Europe', 'Europe', 'Europe'
-    ],
-    'Fully_Vaccinated_Number': [
-        df_africa['2021-01-15'].sum(), df_africa['2021-02-01'].sum(),
-        df_africa['2021-02-15'].sum(), df_africa['2021-03-01'].sum(),
-        df_africa['2021-03-15'].sum(), df_africa['2021-04-01'].sum(),
-        df_africa['2021-04-15'].sum(),
-        df_europe['2021-01-15'].sum(), df_europe['2021-02-01'].sum(),
-        df_europe['2021-02-15'].sum(), df_europe['2021-03-01'].sum(),
-        df_europe['2021-03-15'].sum(), df_europe['2021-04-01'].sum(),
-        df_europe['2021-04-15'].sum(),
-    ]
-}
-
-df_total_vacs = pd.DataFrame(date_data)
-
-# Create line graph
-figure_line = px.line(
-    df_total_vacs,
-    x='Date',
-    y='Fully_Vaccinated_Number',
-    color='Continent',
-    markers=False,
-    range_x=['2021-01-15', '2021-04-15'],
-    color_discrete_map={
-        'Africa': 'red',
-        'Europe': 'blue'
-    },
-)
+# Serialized figures by data version: a line graph per dropdown value and a map per derived metric
+# (the cumulative map is the state's own), for the current and previous versions. The dropdown's date
+# grid needs pandas, so the warm-up sizes the cache.
+figure_cache = LRUCache()
 
-figure_line.update_xaxes(
-    title_text='Date',
-    title_font={'size': 18},
-    showgrid=False,
-)
 
-figure_line.update_yaxes(
-    title_text='Number of fully vaccinated people',
-    title_font={'size': 18},
-    showgrid=False,
-)
+def figure_cache_size():
+    from derived import METRICS
 
-figure_line.update_layout(
-    title={
-        'text': 'Total Number of Covid-19 Fully Vaccinated People in Europe Compared to Africa',
-        'y': 1,
-        'x': 0.5,
-        'xanchor': 'center',
-        'yanchor': 'top',
-    },
-    font_family='Calibri',
-    title_font_size=21,
-    margin={'r': 150, 't': 50, 'l': 150, 'b': 50},
-)
+    return 2 * (len(config.range_options) + len(METRICS) - 1)
 
-# CHOROPLETH MAP
 
-# map only needs African and European countries, so a list is created to identify these countries
-Africa_Europe = [
-    'Algeria', 'Angola', 'Benin', 'Botswana', 'Burkina Faso', 'Cameroon', 'Cape Verde', 'Central African Republic',
-    'Chad', 'Comoros', 'Congo', "Cote d'Ivoire", 'Democratic Republic of the Congo', 'Djibouti', 'Egypt',
-    'Equatorial Guinea', 'Eswatini', 'Ethiopia', 'Gabon', 'Gambia', 'Ghana', 'Guinea', 'Guinea-Bissau', 'Kenya',
-    'Lesotho', 'Libya', 'Liberia', 'Madagascar', 'Malawi', 'Mali', 'Mauritania', 'Mauritius', 'Morocco', 'Mozambique',
-    'Namibia', 'Niger', 'Nigeria', 'Rwanda', 'Saint Helena', 'Sao Tome and Principe', 'Senegal', 'Seychelles',
-    'Sierra Leone', 'Somalia', 'South Africa', 'Sudan', 'Togo', 'Tunisia', 'Uganda', 'Zambia', 'Zimbabwe', 'Andorra',
-    'Albania', 'Austria', 'Azerbaijan', 'Belarus', 'Belgium', 'Bosnia and Herzegovina', 'Bulgaria', 'Croatia', 'Cyprus',
-    'Czechia', 'Denmark', 'Estonia', 'Faeroe Islands', 'Finland', 'France', 'Georgia', 'Germany', 'Gibraltar', 'Greece',
-    'Guernsey', 'Hungary', 'Iceland', 'Ireland', 'Isle of Man', 'Italy', 'Jersey', 'Kosovo', 'Latvia', 'Liechtenstein',
-    'Lithuania', 'Luxembourg', 'Malta', 'Moldova', 'Monaco', 'Montenegro', 'Netherlands', 'North Macedonia',
-    'Northern Cyprus', 'Norway', 'Poland', 'Portugal', 'Romania', 'San Marino', 'Serbia', 'Slovakia', 'Slovenia',
-    'Spain', 'Sweden', 'Switzerland', 'Turkey', 'Ukraine', 'United Kingdom',
-]
+@functools.lru_cache(maxsize=None)
+def figure_store():
+    # Prebuilt figures by data version, next to the data snapshots, or None when turned off
+    if not FIGURE_STORE:
+        return None
+    import data_source
 
-# Update dataframe with country list
-df_final = df_final.loc[df_final['country'].isin(Africa_Europe)]
-
-# Update date format
-df_choropleth = df_final
-df_choropleth['date'] = pd.to_datetime(df_choropleth['date'], format='%Y-%m-%d')
-df_choropleth['date'] = df_choropleth['date'].dt.strftime('%d %b %Y')
-
-# Create choropleth map
-fig = px.choropleth(
-    df_final,
-    locations='iso_code',
-    color='people_fully_vaccinated',
-    hover_name='country',
-    scope='world',
-    color_continuous_scale='bluered',
-    range_color=[0, 9000000],
-    animation_frame='date',
-)
+    return DiskCache(
+        os.path.join(os.environ.get('CETM25_CACHE_DIR', data_source.DEFAULT_CACHE_DIR), 'figures'),
+        max_bytes=512 * 1024 * 1024,
+    )
 
-fig.update_xaxes(
-    domain=[0, 0.5],
-    tickformat='%d %b %Y',
-)
 
-fig.update_layout(
-    title={
-        'text': 'Number of Fully Vaccinated People per Country',
-        'y': 1,
-        'x': 0.4,
-        'xanchor': 'center',
-        'yanchor': 'top',
-    },
-    font_family='Calibri',
-    title_font_size=21,
-    coloraxis_colorbar=dict(title='Fully Vaccinated Numbers'),
-    margin={'r': 600, 't': 50, 'l': 100, 'b': 0},
-    height=700,
-    width=1800,
-    transition={'duration': 3000},
-)
+def line_graph_figure(state, range_end):
+    return figure_cache.get_or_build(
+        ('line_graph', state.version, range_end),
+        lambda: state.build_line_figure(range_end),
+    )
+
 
-fig.layout.updatemenus[0].buttons[0].args[1]['frame']['duration'] = 1000
+def load_dataset(refresh=None, known_version=None):
+    # Returns None without running the pipeline when the source is still at known_version
+    import data_source
+    from dataset import (
+        build_dataset,
+        stream_dataset,
+    )
 
-fig.update_geos(projection_scale=1,
-                resolution=110,
-                )
+    if CHUNKSIZE > 0:
+        with metrics.stage('stream_dataset'):
+            return stream_dataset(data_source.default_source(), config, CHUNKSIZE, known_version=known_version)
+    with metrics.stage('load_snapshot'):
+        snapshot = data_source.load_snapshot(refresh=refresh)
+    if snapshot.version == known_version:
+        return None
+    with metrics.stage('build_dataset'):
+        return build_dataset(snapshot, config)
+
+
+def build_state(dataset, previous=None, parallel=False):
+    with metrics.stage('build_figures'):
+        tasks = precompute.figure_tasks(
+            dataset,
+            include_map=previous is None or previous.version != dataset.version,
+            map_geojson=map_geojson,
+        )
+        prebuilt = prebuilt_figures(dataset, tasks, parallel)
+        state = DashboardState(
+            dataset,
+            LAZY_MAP_FRAMES,
+            previous=previous,
+            map_figure=prebuilt.pop(('map',), None),
+            map_geojson=map_geojson,
+        )
+        # Every line graph variant is in the cache before the state is swapped in
+        for (_, range_end), figure in prebuilt.items():
+            figure_cache.put(('line_graph', state.version, range_end), figure)
+    return state
+
+
+def prebuilt_figures(dataset, tasks, parallel):
+    # Versions from an incremental refresh change with every refresh that touches the grid and are
+    # never seen by a fresh process, so they are not stored. The figures also depend on the
+    # configuration and on the code that builds them.
+    key = 'figures:v{}:{}:{}:{}:{}'.format(
+        figures.FIGURE_FORMAT, config.digest, dataset.version, map_geojson, sorted(tasks),
+    )
+    store = figure_store() if '+' not in dataset.version else None
+    if store is not None:
+        stored = store.get(key)
+        if stored is not None:
+            return {tuple(task_key): figure for task_key, figure in stored}
+    # Forking a pool from a process that is already serving requests on several threads is not
+    # safe, so only the blocking startup build runs in parallel
+    prebuilt = precompute.precompute(tasks, workers=None if parallel else 1)
+    if store is not None:
+        store.put(key, [[list(task_key), figure] for task_key, figure in prebuilt.items()])
+        # There is one put per data version, far fewer than DiskCache's periodic size check waits for
+        store.trim()
+    return prebuilt
+
+
+def initial_dataset():
+    if SHARED_MEMORY:
+        import shared_dataset
+
+        shared = shared_dataset.attach(config)
+        if shared is not None:
+            return shared
+        logger.warning('No dataset has been published to shared memory, loading it in this process')
+    return load_dataset()
+
+
+def rebuild_state(current):
+    import data_source
+    import shared_dataset
+
+    if SHARED_MEMORY:
+        # Switch to a newly published segment, by its version counter
+        shared = shared_dataset.attach(config, known_counter=getattr(current.dataset, 'counter', None))
+        if shared is None:
+            return None
+        return build_state(shared, previous=current)
+    if REFRESH_MODE == 'incremental':
+        dataset = current.dataset.copy()
+        with metrics.stage('incremental_ingest'):
+            dataset.append(data_source.load_new_rows(dataset.last_date))
+        if dataset.last_date == current.dataset.last_date:
+            return None
+    else:
+        dataset = load_dataset(refresh=True, known_version=current.dataset.version)
+        if dataset is None:
+            return None
+    return build_state(dataset, previous=current)
+
+
+def drop_stale_figures(old, new):
+    versions = {new.version} if old is None else {old.version, new.version}
+    figure_cache.evict(lambda key: key[1] not in versions)
+
+
+def warm_up(warmup):
+    with warmup.step('load_data'):
+        figure_cache.maxsize = figure_cache_size()
+        dataset = initial_dataset()
+    with warmup.step('build_figures'):
+        state = build_state(dataset, parallel=WARMUP == 'blocking')
+    holder.swap(state)
+    if WARMUP == 'background':
+        start_refresher()
+
+
+# CHOROPLETH MAP
+
+# The map is built along with the line graph variants, as part of the state. Until the warm-up has
+# swapped in the first state, holder.current is None.
+holder = StateHolder(None)
+holder.on_swap(drop_stale_figures)
+warmup = Warmup(['load_data', 'build_figures'], warm_up)
+
+
+def start_warmup():
+    # Threads do not survive a fork, so in background mode this runs in each serving process
+    if WARMUP == 'background':
+        warmup.start()
 
 # DASHBOARD
 
@@ -243,6 +285,14 @@ annotations = [
     'out of our hands, so please ignore it.',
 ]
 
+if geometry is not None:
+    # The shapes from geometry.py are keyed by the data's ISO codes and leave French Guiana out of France
+    annotations[3] = (
+        'French Guiana is a country in South America and is an overseas region of France. Most world maps draw it '
+        'as part of France, so this map uses its own country shapes, keyed by ISO code, in which French Guiana is not '
+        'shaded as France.'
+    )
+
 # List of footnotes used in RadioItems
 footnote = [
     '',
@@ -252,391 +302,721 @@ footnote = [
     (Accessed: 17 November 2021).''',
 ]
 
-# Create dashboard
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# Create dashboard. While warming up in the background the page is a loading layout, without the
+# components the callbacks refer to.
+app = dash.Dash(
+    __name__,
+    external_stylesheets=[dbc.themes.BOOTSTRAP],
+    suppress_callback_exceptions=WARMUP == 'background',
+)
 
-# Define layout
-app.layout = dbc.Container(
-    [
-        # Heading row
-        dbc.Row(
-            [
-                dbc.Col(
-                    html.H1(
-                        'Comparing the Availability of Covid-19 Vaccinations in Europe and Africa',
-                        className='text-center mb-4',
+# Callback timings, pipeline stage timings and cache counters on /metrics
+metrics.install(app.server)
+metrics.watch_cache('figures', figure_cache)
+
+# Callback outputs, keyed by callback id, inputs and data version
+callback_cache = cache_from_url(CALLBACK_CACHE, ttl=CALLBACK_CACHE_TTL)
+metrics.watch_cache('callbacks', callback_cache)
+
+
+def data_version():
+    return holder.current.version
+
+
+def daily_version():
+    # An incremental refresh can add days without changing any grid date, and so the version
+    state = holder.current
+    if state is None:
+        return None
+    return '{}@{}'.format(state.version, getattr(state.dataset, 'last_date', None))
+
+
+# Daily line graph of a metric (see derived.py) for the range between start and end
+@cached_callback(callback_cache, 'daily_line', daily_version)
+def daily_line_figure(start, end, metric='cumulative'):
+    import downsample
+    from derived import METRICS
+
+    state = holder.current
+    if state.dataset.daily_totals is None:
+        # The daily series is not kept with chunked ingest or shared memory
+        return line_graph_figure(state, config.range_options[-1]['value'])
+    if metric == 'cumulative':
+        totals, y_title = state.dataset.daily_totals, 'Number of fully vaccinated people'
+    else:
+        totals, y_title = state.dataset.cube.region_totals(metric), METRICS[metric]
+    frame = downsample.window_frame(totals, start, end, LINE_POINTS, DOWNSAMPLE)
+    return figures.to_figure_json(
+        figures.build_line_figure(
+            frame,
+            range_x=[start, end],
+            colors=config.region_colors,
+            render_mode='webgl' if LINE_WEBGL else 'auto',
+            y_title=y_title,
+        )
+    )
+
+
+# Choropleth coloured by a metric, built on first use and cached with the other figures
+def build_metric_map(state, metric, geojson):
+    # The full map, every frame included, coloured by a derived metric
+    from dataset import metric_choropleth_rows
+    from derived import (
+        METRICS,
+        color_range,
+    )
+
+    rows = metric_choropleth_rows(state.dataset.cube, config, metric)
+    label = METRICS[metric]
+    return figures.to_figure_json(
+        figures.build_choropleth_figure(
+            rows,
+            geojson=geojson,
+            color=label,
+            range_color=color_range(rows[label].to_numpy()),
+            color_title=label,
+        )
+    )
+
+
+def metric_map(state, metric):
+    # A derived metric's map and its animation frames payload (None without lazy frames),
+    # built on first use; the cumulative map is the state's own
+    def build():
+        figure_map = build_metric_map(state, metric, map_geojson)
+        if not state.lazy_map_frames:
+            return figure_map, None
+        initial, frames = figures.split_frames(figure_map)
+        return initial, CompressedPayload(json.dumps(frames, separators=(',', ':')).encode())
+    return figure_cache.get_or_build(('map', state.version, metric), build)
+
+
+def metric_map_figure(state, metric):
+    # The map figure and its frames URL for the chosen metric
+    if metric == 'cumulative' or state.dataset.cube is None:
+        return state.map_figure, state.map_frames_url
+    figure_map, _ = metric_map(state, metric)
+    if not state.lazy_map_frames:
+        return figure_map, None
+    return figure_map, '/_cetm25/map-frames/{}/{}.json'.format(state.version, metric)
+
+
+def metric_options(state):
+    from derived import METRICS
+
+    # The derived metrics need the daily series
+    metrics_available = list(METRICS) if state.dataset.cube is not None else ['cumulative']
+    return [{'label': METRICS[metric], 'value': metric} for metric in metrics_available]
+
+
+def initial_line_figure(state):
+    range_end = config.range_options[-1]['value']
+    if LINE_MODE == 'daily':
+        return daily_line_figure(config.dates[0], range_end)
+    return line_graph_figure(state, range_end)
+
+
+# Liveness: the process is up and its warm-up has not failed
+@app.server.route('/healthz')
+def healthz():
+    if warmup.failed:
+        return flask.jsonify(status='failed', error=warmup.error), 500
+    return flask.jsonify(status='ok')
+
+
+# Readiness, with the warm-up's progress
+@app.server.route('/ready')
+def ready():
+    status = warmup.status()
+    return flask.jsonify(status), 200 if status['ready'] else 503
+
+
+# Totals, deltas and averages per region over any date range, e.g.
+# /api/v1/range?region=Europe&start=2021-02-01&end=2021-03-01. series is 'daily' (the default, when the
+# daily series is kept) or 'grid' (the configured dates, as on the cards).
+@app.server.route('/api/v1/range')
+def range_api():
+    state = holder.current
+    if state is None:
+        return flask.jsonify(error='The data is still loading'), 503
+    args = flask.request.args
+    queries = state.queries.get(args.get('series', 'daily' if 'daily' in state.queries else 'grid'))
+    if queries is None:
+        return flask.jsonify(error='Unknown or unavailable series {!r}'.format(args.get('series'))), 400
+    regions = args.getlist('region') or queries.regions
+    try:
+        results = [queries.query(region, args.get('start'), args.get('end')) for region in regions]
+    except ValueError as error:
+        return flask.jsonify(error=str(error)), 400
+    return flask.jsonify(version=state.version, results=results)
+
+
+# Map frames for the current data version, or the previous one for pages loaded just before a refresh
+@app.server.route('/_cetm25/map-frames/<version>.json')
+def serve_map_frames(version):
+    state = holder.find(version)
+    if state is None or state.map_frames_payload is None:
+        flask.abort(404)
+    return state.map_frames_payload.response(max_age=IMMUTABLE_MAX_AGE, immutable=True)
+
+
+# Frames for a map coloured by a derived metric, see metric_map
+@app.server.route('/_cetm25/map-frames/<version>/<metric>.json')
+def serve_metric_map_frames(version, metric):
+    from derived import METRICS
+
+    state = holder.find(version)
+    if (state is None or not state.lazy_map_frames or state.dataset.cube is None
+            or metric not in METRICS or metric == 'cumulative'):
+        flask.abort(404)
+    _, payload = metric_map(state, metric)
+    return payload.response(max_age=IMMUTABLE_MAX_AGE, immutable=True)
+
+
+# Country shapes by level of detail, the URLs change whenever the shapes do
+@app.server.route('/_cetm25/geo/<name>-<content_hash>.json')
+def serve_geometry(name, content_hash):
+    payload = geometry.payload(name, content_hash) if geometry is not None else None
+    if payload is None:
+        flask.abort(404)
+    return payload.response(max_age=IMMUTABLE_MAX_AGE, immutable=True)
+
+
+# Card with a region's fully vaccinated total, filled in by update_tags
+def region_card(i, region):
+    return dbc.Row(
+        [
+            dbc.Col(
+                [
+                    dbc.Card(
+                        [
+                            html.H1(
+                                id='tag{}'.format(i + 1),
+                                className='card-title ',
+                                style={
+                                    'font-size': '20px',
+                                    'font-family': 'Calibri',
+                                },
+                            ),
+                            html.P(
+                                'Fully vaccinated numbers in {}'.format(region.name),
+                                className='card-text ',
+                                style={
+                                    'font-size': '13px',
+                                    'font-family': 'Calibri',
+                                },
+                            ),
+                        ],
+                        style={
+                            'padding': '7px',
+                            'width': '205px',
+                            'font-family': 'Calibri',
+                            'font-size': '60px'
+                        },
+                        className='text-center mb-4 ' + region.card_class,
                     ),
-                    width=12,
-                    style={
-                        'margin-top': '30px',
-                        'font-family': 'Calibri',
-                    },
-                ),
-            ],
-        ),
-
-        # Row containing RadioItems with overview, explanations, pitfalls options
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        dcc.RadioItems(
-                            id='my-radio',
-                            style={'padding': '10px'},
-                            labelStyle={
-                                'padding': '10px',
-                                'font-family': 'Calibri',
-                            },
-                            labelClassName='font-weight-bold',
-                            value=annotations[0],
-                            options=[
-                                {'label': 'Overview', 'value': annotations[0]},
-                                {'label': 'Line Chart Explanation', 'value': annotations[1]},
-                                {'label': 'Map Chart Explanation', 'value': annotations[2]},
-                                {'label': 'Pitfalls', 'value': annotations[3]},
-                            ],
-                        ),
-                    ],
-                    className='text-center mb-4',
-                ),
-            ],
-        ),
-
-        # Row that contains the markdown that will contain overview, explanations, pitfalls
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        dcc.Markdown(id='my-markdown')
-                    ],
-                    width={
-                        'size': 10,
-                        'offset': 1
-                    },
-                    className='font-weight-light text-justify mb-4',
-                    style={'font-family': 'Calibri'},
-                ),
-            ],
-        ),
-
-        # Row that contains the line graph, dropdown column and cards
-        dbc.Row(
-            [
-                # Column that contains the line graph
-                dbc.Col(
-                    [
-                        dcc.Graph(
-                            id='line_graph',
-                            figure=figure_line,
-                            style={'margin-bottom': '5em'}
-                        ),
-                    ],
-                    width={
-                        'size': 9,
-                        'offset': 0,
-                    },
-                    style={
-                        'margin-top': '30px',
-                        'margin-left': '30px',
-                    },
-
-                ),
-                # Column that contains the dropdown and cards
-                dbc.Col(
-                    [
-                        # Row that contains the dropdown
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    [
-                                        html.P(
-                                            'Filter by Month:',
-                                            style={
-                                                'font-size': '18px',
-                                                'font-family': 'Calibri',
-                                                'margin-left': '30px',
-                                            },
-                                        ),
-                                        dcc.Dropdown(
-                                            id='my-dropdown',
-                                            value='2021-04-15',
-                                            style={
-                                                'width': '200px',
-                                                'margin': 'auto',
-                                            },
-                                            options=[
-                                                {'label': 'First Month', 'value': '2021-02-15'},
-                                                {'label': 'Second Month', 'value': '2021-03-15'},
-                                                {'label': 'Third Month', 'value': '2021-04-15'},
-                                            ],
-                                        ),
-                                    ],
-                                    style={
-                                        'padding': '0px',
-                                        'margin-top': '50px',
-                                        'margin-bottom': '70px'
-                                    },
-                                ),
-                            ],
-                        ),
+                ],
+                style={
+                    'margin-top': '40px' if i == 0 else '0px',
+                    'margin-bottom': '0px',
+                    'margin-left': '10px',
+                },
+            ),
+        ],
+    )
 
-                        # Row that contains Card 1
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    [
-                                        dbc.Card(
-                                            [
-                                                html.H1(
-                                                    id='tag1',
-                                                    className='card-title ',
-                                                    style={
-                                                        'font-size': '20px',
-                                                        'font-family': 'Calibri',
-                                                    },
-                                                ),
-                                                html.P(
-                                                    'Fully vaccinated numbers in Africa',
-                                                    className='card-text ',
-                                                    style={
-                                                        'font-size': '13px',
-                                                        'font-family': 'Calibri',
-                                                    },
-                                                ),
-                                            ],
-                                            style={
-                                                'padding': '7px',
-                                                'width': '205px',
-                                                'font-family': 'Calibri',
-                                                'font-size': '60px'
-                                            },
-                                            className='text-center mb-4 border-danger',
-                                        ),
-                                    ],
-                                    style={
-                                        'margin-top': '40px',
-                                        'margin-bottom': '0px',
-                                        'margin-left': '10px',
-                                    },
-                                ),
-                            ],
-                        ),
 
-                        # Row that contains Card 2
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    [
-                                        dbc.Card(
-                                            [
-                                                html.H1(
-                                                    id='tag2',
-                                                    className='card-title ',
-                                                    style={
-                                                        'font-size': '20px',
-                                                        'font-family': 'Calibri'
-                                                    },
-                                                ),
-                                                html.P(
-                                                    'Fully vaccinated numbers in Europe',
-                                                    className='card-text ',
-                                                    style={
-                                                        'font-size': '13px',
-                                                        'font-family': 'Calibri'
-                                                    },
-                                                ),
-                                            ],
-                                            body=True,
-                                            color='white',
-                                            style={
-                                                'padding': '7px',
-                                                'width': '205px',
-                                                'font-family': 'Calibri',
-                                                'font-size': '60px'
-                                            },
-                                            className='text-center mb-4 border-primary'
-                                        ),
-                                    ],
-                                    style={
-                                        'margin-left': '10px',
-                                    },
-                                ),
-                            ],
-                        ),
-                    ],
-                    width={
-                        'size': 2,
-                        'offset': 0
-                    },
-                ),
-            ],
-        ),
-
-        # Row that contains the choropleth map
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        dcc.Graph(
-                            id='map',
-                            figure=fig,
-                        ),
-                    ],
-                    width={
-                        'size': 5,
-                        'offset': 0,
-                    },
-                    style={'margin-bottom': '30px'},
-                ),
-            ],
-        ),
-
-        # Row that contains RadioItems with data source options
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.H6(
-                            'Data Source:',
-                            className='text-left',
-                        ),
-                        dcc.RadioItems(
-                            id='my-radioitem2',
-                            style={
-                                'padding': '2px',
-                                'font-size': '15px',
-                                'font-family': 'Calibri'
-                            },
-                            labelStyle={
-                                'font-family': 'Calibri',
-                                'display': 'flex'
-                            },
-                            labelClassName='font-weight-bold',
-                            value=footnote[0],
-                            options=[
-                                {'label': 'Hide', 'value': footnote[0]},
-                                {'label': 'Show', 'value': footnote[1]},
-                            ],
+# Shown until the first state has been built, and reloads the page once /ready says so
+def loading_layout():
+    return dbc.Container(
+        [
+            html.H1(
+                'Comparing the Availability of Covid-19 Vaccinations in Europe and Africa',
+                className='text-center mb-4',
+                style={
+                    'margin-top': '30px',
+                    'font-family': 'Calibri',
+                },
+            ),
+            html.P(
+                'Loading the latest data, the dashboard will appear in a moment.',
+                className='text-center',
+                style={'font-family': 'Calibri'},
+            ),
+            dcc.Interval(id='warmup-poll', interval=1000),
+            dcc.Store(id='warmup-url', data='/ready'),
+            dcc.Store(id='warmup-reload'),
+        ],
+        fluid=True,
+    )
+
+
+# Define layout, rebuilt on every page load so that it always shows the current data version
+def serve_layout():
+    state = holder.current
+    if state is None:
+        return loading_layout()
+    return dbc.Container(
+        [
+            # Heading row
+            dbc.Row(
+                [
+                    dbc.Col(
+                        html.H1(
+                            'Comparing the Availability of Covid-19 Vaccinations in Europe and Africa',
+                            className='text-center mb-4',
                         ),
-                    ],
-                    width={'offset': 1},
-                    style={'margin-bottom': '20px'},
-                ),
-            ],
-        ),
-
-        # Row that contains the markdown with the data source
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        dcc.Markdown(id='my-footnote')
-                    ],
-                    width={
-                        'size': 10,
-                        'offset': 1,
-                    },
-                    className='font-weight-light text-justify',
-                    style={'font-family': 'Calibri'},
-                ),
-            ],
-        ),
-    ],
-    fluid=True,
+                        width=12,
+                        style={
+                            'margin-top': '30px',
+                            'font-family': 'Calibri',
+                        },
+                    ),
+                ],
+            ),
+
+            # Row containing RadioItems with overview, explanations, pitfalls options
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            dcc.RadioItems(
+                                id='my-radio',
+                                style={'padding': '10px'},
+                                labelStyle={
+                                    'padding': '10px',
+                                    'font-family': 'Calibri',
+                                },
+                                labelClassName='font-weight-bold',
+                                value=annotations[0],
+                                options=[
+                                    {'label': 'Overview', 'value': annotations[0]},
+                                    {'label': 'Line Chart Explanation', 'value': annotations[1]},
+                                    {'label': 'Map Chart Explanation', 'value': annotations[2]},
+                                    {'label': 'Pitfalls', 'value': annotations[3]},
+                                ],
+                            ),
+                        ],
+                        className='text-center mb-4',
+                    ),
+                ],
+            ),
+
+            # Row that contains the markdown that will contain overview, explanations, pitfalls
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            dcc.Markdown(id='my-markdown')
+                        ],
+                        width={
+                            'size': 10,
+                            'offset': 1
+                        },
+                        className='font-weight-light text-justify mb-4',
+                        style={'font-family': 'Calibri'},
+                    ),
+                ],
+            ),
+
+            # Row that contains the line graph, dropdown column and cards
+            dbc.Row(
+                [
+                    # Column that contains the line graph
+                    dbc.Col(
+                        [
+                            dcc.Graph(
+                                id='line_graph',
+                                figure=initial_line_figure(state),
+                                style={'margin-bottom': '5em'}
+                            ),
+                        ],
+                        width={
+                            'size': 9,
+                            'offset': 0,
+                        },
+                        style={
+                            'margin-top': '30px',
+                            'margin-left': '30px',
+                        },
+
+                    ),
+                    # Column that contains the dropdown and cards
+                    dbc.Col(
+                        [
+                            # Row that contains the dropdown
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        [
+                                            html.P(
+                                                'Filter by Month:',
+                                                style={
+                                                    'font-size': '18px',
+                                                    'font-family': 'Calibri',
+                                                    'margin-left': '30px',
+                                                },
+                                            ),
+                                            dcc.Dropdown(
+                                                id='my-dropdown',
+                                                value=config.range_options[-1]['value'],
+                                                style={
+                                                    'width': '200px',
+                                                    'margin': 'auto',
+                                                },
+                                                options=config.range_options,
+                                            ),
+                                        ],
+                                        style={
+                                            'padding': '0px',
+                                            'margin-top': '50px',
+                                            'margin-bottom': '70px'
+                                        },
+                                    ),
+                                ],
+                            ),
+
+                            # Rows that contain one card per region
+                            *[region_card(i, region) for i, region in enumerate(config.regions)],
+                        ],
+                        width={
+                            'size': 2,
+                            'offset': 0
+                        },
+                    ),
+                ],
+            ),
+
+            # Row that contains the choropleth map
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.P(
+                                'Colour by:',
+                                style={
+                                    'font-size': '18px',
+                                    'font-family': 'Calibri',
+                                    'margin-left': '30px',
+                                },
+                            ),
+                            dcc.Dropdown(
+                                id='my-metric',
+                                value='cumulative',
+                                clearable=False,
+                                style={
+                                    'width': '300px',
+                                    'margin-left': '15px',
+                                },
+                                options=metric_options(state),
+                            ),
+                            dcc.Graph(
+                                id='map',
+                                figure=state.map_figure,
+                            ),
+                            dcc.Store(
+                                id='map-frames-url',
+                                data=state.map_frames_url,
+                            ),
+                            dcc.Store(id='map-frames-loaded'),
+                            dcc.Store(
+                                id='map-geometry',
+                                data=[
+                                    {'name': level['name'], 'url': level['url'], 'max_scale': level['max_scale']}
+                                    for level in geometry.levels
+                                ] if geometry is not None else None,
+                            ),
+                            dcc.Store(id='map-geometry-level'),
+                        ],
+                        width={
+                            'size': 5,
+                            'offset': 0,
+                        },
+                        style={'margin-bottom': '30px'},
+                    ),
+                ],
+            ),
+
+            # Row that contains the daily series of the country clicked on the map
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            dcc.Graph(id='country_graph'),
+                        ],
+                        width={
+                            'size': 9,
+                            'offset': 0,
+                        },
+                        style={
+                            'margin-left': '30px',
+                            'margin-bottom': '30px',
+                        },
+                    ),
+                ],
+            ),
+
+            # Row that contains RadioItems with data source options
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.H6(
+                                'Data Source:',
+                                className='text-left',
+                            ),
+                            dcc.RadioItems(
+                                id='my-radioitem2',
+                                style={
+                                    'padding': '2px',
+                                    'font-size': '15px',
+                                    'font-family': 'Calibri'
+                                },
+                                labelStyle={
+                                    'font-family': 'Calibri',
+                                    'display': 'flex'
+                                },
+                                labelClassName='font-weight-bold',
+                                value=footnote[0],
+                                options=[
+                                    {'label': 'Hide', 'value': footnote[0]},
+                                    {'label': 'Show', 'value': footnote[1]},
+                                ],
+                            ),
+                        ],
+                        width={'offset': 1},
+                        style={'margin-bottom': '20px'},
+                    ),
+                ],
+            ),
+
+            # Row that contains the markdown with the data source
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            dcc.Markdown(id='my-footnote')
+                        ],
+                        width={
+                            'size': 10,
+                            'offset': 1,
+                        },
+                        className='font-weight-light text-justify',
+                        style={'font-family': 'Calibri'},
+                    ),
+                ],
+            ),
+        ],
+        fluid=True,
+    )
+
+
+app.layout = serve_layout
+
+# The layout only changes with the data, so it is serialized and compressed once per data version and
+# served with an ETag. The loading layout is not cached.
+layout_cache = LRUCache(maxsize=4)
+metrics.watch_cache('layout', layout_cache)
+http_cache.cache_view(app.server, app.config.routes_pathname_prefix + '_dash-layout', daily_version, layout_cache)
+
+# Large callback responses, e.g. the figures, compressed once per distinct body
+response_cache = LRUCache(maxsize=64)
+metrics.watch_cache('responses', response_cache)
+http_cache.compress_responses(
+    app.server,
+    app.config.routes_pathname_prefix + '_dash-update-component',
+    COMPRESS_MIN_BYTES,
+    response_cache,
 )
 
 
 # CALLBACKS
 
 # Overview, explanations and pitfalls
-@app.callback(
-    Output('my-markdown', 'children'),
-    Input('my-radio', 'value'),
-)
 def update_output(value):
     return '{}'.format(value)
 
 
 # Data source
-@app.callback(
-    Output('my-footnote', 'children'),
-    Input('my-radioitem2', 'value'),
-)
 def update_footnote(value):
     return '{}'.format(value)
 
 
 # Line graph
-@app.callback(
-    Output('line_graph', 'figure'),
-    Input('my-dropdown', 'value'),
-)
+@cached_callback(callback_cache, 'update_graph', data_version)
 def update_graph(toggle_value):
-    print(type(toggle_value))
-    dff = pd.DataFrame(date_data)
-    fig = px.line(
-        dff,
-        x='Date',
-        y='Fully_Vaccinated_Number',
-        color='Continent',
-        range_x=['2021-01-15', toggle_value],
-        color_discrete_map={
-            'Africa': 'red',
-            'Europe': 'blue',
-        },
+    return line_graph_figure(holder.current, toggle_value)
+
+
+# Daily line graph, redrawn for the dropdown range, the range zoomed or panned to, or another metric
+def update_daily_graph(range_end, relayout_data, metric, figure):
+    triggered = [trigger['prop_id'] for trigger in callback_context.triggered]
+    start, end = config.dates[0], range_end
+    if 'my-metric.value' in triggered:
+        # Keep the visible range
+        xaxis = ((figure or {}).get('layout') or {}).get('xaxis') or {}
+        if xaxis.get('range'):
+            start, end = xaxis['range']
+    elif 'line_graph.relayoutData' in triggered and relayout_data:
+        if 'xaxis.range[0]' in relayout_data:
+            start, end = relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+        elif 'xaxis.range' in relayout_data:
+            start, end = relayout_data['xaxis.range']
+        elif not relayout_data.get('xaxis.autorange'):
+            # Resizing, hovering and the like do not change the visible range
+            raise PreventUpdate
+    return daily_line_figure(start, end, metric)
+
+
+if CLIENTSIDE_CALLBACKS:
+    # These only echo a value, so they do not need a round trip to the server
+    app.clientside_callback(
+        ClientsideFunction(namespace='cetm25', function_name='echo'),
+        Output('my-markdown', 'children'),
+        Input('my-radio', 'value'),
     )
-    fig.update_xaxes(
-        title_text='Date',
-        title_font={'size': 18},
-        showgrid=False,
-        tickformat='%d %b %Y'
+    app.clientside_callback(
+        ClientsideFunction(namespace='cetm25', function_name='echo'),
+        Output('my-footnote', 'children'),
+        Input('my-radioitem2', 'value'),
     )
-    fig.update_yaxes(
-        title_text='Number of fully vaccinated people',
-        title_font={'size': 18},
-        showgrid=False,
+else:
+    app.callback(
+        Output('my-markdown', 'children'),
+        Input('my-radio', 'value'),
+    )(update_output)
+    app.callback(
+        Output('my-footnote', 'children'),
+        Input('my-radioitem2', 'value'),
+    )(update_footnote)
+
+# An output can only belong to one callback, so in daily mode the dropdown and the zoom share one
+if LINE_MODE == 'daily':
+    app.callback(
+        Output('line_graph', 'figure'),
+        Input('my-dropdown', 'value'),
+        Input('line_graph', 'relayoutData'),
+        Input('my-metric', 'value'),
+        State('line_graph', 'figure'),
+        prevent_initial_call=True,
+    )(update_daily_graph)
+elif CLIENTSIDE_CALLBACKS:
+    # Moving the x-axis range does not need a round trip to the server either
+    app.clientside_callback(
+        ClientsideFunction(namespace='cetm25', function_name='set_line_range'),
+        Output('line_graph', 'figure'),
+        Input('my-dropdown', 'value'),
+        State('line_graph', 'figure'),
+        prevent_initial_call=True,
     )
-    fig.update_layout(
-        title={
-            'text': 'Total Number of Covid-19 Fully Vaccinated People in Europe Compared to Africa',
-            'y': 1,
-            'x': 0.5,
-            'xanchor': 'center',
-            'yanchor': 'top',
-        },
-        font_family='Calibri',
-        title_font_size=21,
-        margin={
-            'r': 100,
-            't': 50,
-            'l': 100,
-            'b': 50,
-        },
+else:
+    app.callback(
+        Output('line_graph', 'figure'),
+        Input('my-dropdown', 'value'),
+    )(update_graph)
+
+
+# Choropleth animation frames
+app.clientside_callback(
+    ClientsideFunction(namespace='cetm25', function_name='load_map_frames'),
+    Output('map-frames-loaded', 'data'),
+    Input('map-frames-url', 'data'),
+)
+
+
+# Reload the loading page once the warm-up has finished. Only a background warm-up serves that page.
+if WARMUP == 'background':
+    app.clientside_callback(
+        ClientsideFunction(namespace='cetm25', function_name='reload_when_ready'),
+        Output('warmup-reload', 'data'),
+        Input('warmup-poll', 'n_intervals'),
+        State('warmup-url', 'data'),
     )
-    return fig
 
 
-# Card 1
+# Map coloured by the chosen metric
 @app.callback(
-    Output('tag1', 'children'),
-    Input('my-dropdown', 'value'),
+    [
+        Output('map', 'figure'),
+        Output('map-frames-url', 'data'),
+    ],
+    Input('my-metric', 'value'),
+    prevent_initial_call=True,
 )
-def update_tag1(range_chosen):
-    sum = df_africa[range_chosen].sum()
-    my_sum = '{:,.0f}'.format(sum)
-    return '{}'.format(my_sum)
+def update_map_metric(metric):
+    return metric_map_figure(holder.current, metric)
 
 
-# Card 2
+# Country shapes for the map's zoom level
+app.clientside_callback(
+    ClientsideFunction(namespace='cetm25', function_name='select_map_geometry'),
+    Output('map-geometry-level', 'data'),
+    Input('map', 'relayoutData'),
+    State('map-geometry', 'data'),
+)
+
+
+# Cards, one output per region
 @app.callback(
-    Output('tag2', 'children'),
+    [Output('tag{}'.format(i + 1), 'children') for i in range(len(config.regions))],
     Input('my-dropdown', 'value'),
 )
-def update_tag1(range_chosen):
-    sum = (df_europe[range_chosen].sum())
-    my_sum = '{:,.0f}'.format(sum)
-    return '{}'.format(my_sum)
+@cached_callback(callback_cache, 'update_tags', data_version)
+def update_tags(range_chosen):
+    queries = holder.current.queries['grid']
+    return [
+        '{:,.0f}'.format(queries.query(name, end=range_chosen)['end_value'])
+        for name in config.region_names
+    ]
+
+
+# Daily series of the country clicked on the map, sliced from the dataset's per-country index
+@app.callback(
+    Output('country_graph', 'figure'),
+    Input('map', 'clickData'),
+)
+# An incremental refresh can extend the daily series without changing the version, hence daily_version
+@cached_callback(callback_cache, 'update_country', daily_version)
+def update_country(click_data):
+    series = holder.current.dataset.series
+    country = None
+    if click_data and series is not None:
+        country = series.country_for_iso(click_data['points'][0].get('location'))
+    if country is None:
+        return figures.to_figure_json(figures.build_country_figure(None, None, None))
+    dates, values = series.series(country)
+    return figures.to_figure_json(figures.build_country_figure(country, dates, values))
+
+
+# BACKGROUND REFRESH
+
+refresher = Refresher(holder, rebuild_state, REFRESH_INTERVAL)
+refresher_lock = threading.Lock()
+
+
+def start_refresher():
+    # Called on the first request and at the end of the warm-up, whichever has a state to refresh
+    with refresher_lock:
+        if REFRESH_INTERVAL > 0 and holder.current is not None and refresher.ident is None:
+            refresher.start()
+
+
+# Threads do not survive a fork, so the refresher and a background warm-up are started in whichever
+# process serves requests
+@app.server.before_first_request
+def start_background_threads():
+    start_warmup()
+    start_refresher()
+
+
+if WARMUP != 'background':
+    warmup.run()
+
+
+# WSGI entry point, e.g. for `gunicorn CETM25_visualisation_app:server`; see serve.py for production
+server = app.server
 
 
 if __name__ == '__main__':
+    start_warmup()
     app.run_server()
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+
+class ContinentAggregates:
+    """Dense continent x date array of fully vaccinated totals, built once at load.
+
+    Lookups go through two small dicts into a read-only NumPy array, so callbacks never touch a
+    DataFrame per request.
+    """
+
+    def __init__(self, continents, dates, totals):
+        self.continents = list(continents)
+        self.dates = list(dates)
+        self.totals = totals
+        self.totals.setflags(write=False)
+        self._continent_index = {continent: i for i, continent in enumerate(self.continents)}
+        self._date_index = {date: j for j, date in enumerate(self.dates)}
+
+    @classmethod
+    def from_pivot(cls, df_pivot, continents, dates):
+        # continents maps a continent name to its list of countries. A membership matrix turns every
+        # continent's sums into one matrix product, and a country may belong to several continents.
+        membership = membership_matrix(df_pivot['country'].astype(str).to_numpy(), continents)
+        # Missing readings count as zero, matching DataFrame.sum()
+        values = np.nan_to_num(df_pivot[list(dates)].to_numpy(dtype='float64', na_value=np.nan))
+        return cls(continents, dates, membership @ values)
+
+    @classmethod
+    def from_daily(cls, countries, days, matrix, continents):
+        # Totals for every day, from a CountrySeries' forward-filled country x day matrix
+        membership = membership_matrix(np.asarray(countries, dtype=str), continents)
+        return cls(continents, np.datetime_as_string(days).tolist(), membership @ np.nan_to_num(matrix))
+
+    def copy(self):
+        return ContinentAggregates(self.continents, self.dates, self.totals.copy())
+
+    def update_from_pivot(self, df_pivot, continents, dates):
+        # Recompute only the given date columns, in place
+        fresh = ContinentAggregates.from_pivot(df_pivot, continents, dates)
+        columns = [self._date_index[date] for date in dates]
+        self.totals.setflags(write=True)
+        self.totals[:, columns] = fresh.totals
+        self.totals.setflags(write=False)
+
+    def total(self, continent, date):
+        return self.totals[self._continent_index[continent], self._date_index[date]]
+
+    def to_frame(self):
+        # Long format used by the line graph, one row per continent and date
+        return pd.DataFrame({
+            'Date': np.tile(self.dates, len(self.continents)),
+            'Continent': np.repeat(self.continents, len(self.dates)),
+            'Fully_Vaccinated_Number': self.totals.ravel(),
+        })
+
+
+def membership_matrix(countries, continents):
+    # One row per continent with a 1 for each of its countries
+    return np.array(
+        [np.isin(countries, members) for members in continents.values()],
+        dtype='float64',
+    ).reshape(len(continents), len(countries))
@@ -0,0 +1,69 @@
+// Clientside callbacks, registered from CETM25_visualisation_app.py with ClientsideFunction('cetm25', ...)
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    cetm25: {
+        // Show the selected RadioItems value in a Markdown component
+        echo: function (value) {
+            return String(value);
+        },
+
+        // Only change the end of the line graph x-axis range, keeping the rest of the figure
+        set_line_range: function (rangeEnd, figure) {
+            if (!figure || !figure.layout || !figure.layout.xaxis || !figure.layout.xaxis.range) {
+                return window.dash_clientside.no_update;
+            }
+            const xaxis = Object.assign({}, figure.layout.xaxis, {
+                range: [figure.layout.xaxis.range[0], rangeEnd],
+                autorange: false,
+            });
+            const layout = Object.assign({}, figure.layout, {xaxis: xaxis});
+            return Object.assign({}, figure, {layout: layout});
+        },
+
+        // Fetch the remaining choropleth animation frames and add them to the plot once it has rendered
+        load_map_frames: function (url) {
+            if (!url) {
+                return window.dash_clientside.no_update;
+            }
+            const addFrames = function (frames) {
+                const container = document.getElementById('map');
+                const graphDiv = container && container.querySelector('.js-plotly-plot');
+                if (!graphDiv || !graphDiv._fullLayout || !window.Plotly) {
+                    setTimeout(function () { addFrames(frames); }, 100);
+                    return;
+                }
+                window.Plotly.addFrames(graphDiv, frames);
+            };
+            fetch(url)
+                .then(function (response) { return response.json(); })
+                .then(addFrames);
+            return url;
+        },
+
+        // Poll the readiness endpoint from the loading page, and reload it once the data is ready
+        reload_when_ready: function (nIntervals, url) {
+            fetch(url).then(function (response) {
+                if (response.ok) {
+                    window.location.reload();
+                }
+            });
+            return window.dash_clientside.no_update;
+        },
+
+        // Swap the map's country shapes for the level of detail that suits the zoom, see geometry.py
+        select_map_geometry: function (relayoutData, levels) {
+            const scale = relayoutData && relayoutData['geo.projection.scale'];
+            if (!levels || scale === undefined) {
+                return window.dash_clientside.no_update;
+            }
+            const level = levels.find(function (candidate) {
+                return candidate.max_scale === null || scale <= candidate.max_scale;
+            }) || levels[levels.length - 1];
+            const container = document.getElementById('map');
+            const graphDiv = container && container.querySelector('.js-plotly-plot');
+            if (graphDiv && window.Plotly && graphDiv.data[0].geojson !== level.url) {
+                window.Plotly.restyle(graphDiv, {geojson: level.url});
+            }
+            return level.name;
+        },
+    },
+});
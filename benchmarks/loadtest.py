@@ -0,0 +1,355 @@
+"""Simulate concurrent browser sessions against a running dashboard.
+
+Run from the repository root, for example:
+
+    python -m benchmarks.loadtest --start --workers 4 --concurrency 1,8,32 --duration 20
+
+With --start the app is launched under serve.py against a synthetic CSV; otherwise --url points at an
+instance that is already running. Each simulated session loads the page, the layout and the callback
+dependencies, fires the initial server callbacks, then changes my-dropdown, my-radio, my-radioitem2 and
+my-metric at random with a pause between changes, sending whichever _dash-update-component requests the
+renderer would. Throughput, latency percentiles and the error rate are reported per concurrency level.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Inputs a visitor changes, and how often relative to each other
+ACTIONS = {
+    'my-dropdown': 3,
+    'my-radio': 2,
+    'my-radioitem2': 1,
+    'my-metric': 1,
+}
+
+
+# DASH PROTOCOL
+
+def component_props(layout):
+    # id -> props of every component in the layout tree
+    props = {}
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict) and 'props' in node:
+            if 'id' in node['props']:
+                props[node['props']['id']] = node['props']
+            stack.append(node['props'].get('children'))
+    return props
+
+
+def parse_output(output):
+    # 'id.prop', or '..id1.prop1...id2.prop2..' for a callback with several outputs
+    if output.startswith('..'):
+        return [parse_output(part) for part in output[2:-2].split('...')]
+    id_, prop = output.rsplit('.', 1)
+    return {'id': id_, 'property': prop}
+
+
+def callback_body(dependency, props, changed):
+    def values(items):
+        return [
+            {'id': item['id'], 'property': item['property'], 'value': props.get(item['id'], {}).get(item['property'])}
+            for item in items
+        ]
+    return {
+        'output': dependency['output'],
+        'outputs': parse_output(dependency['output']),
+        'inputs': values(dependency['inputs']),
+        'changedPropIds': changed,
+        'state': values(dependency['state']),
+    }
+
+
+def server_callbacks(dependencies):
+    # Clientside callbacks never reach the server
+    return [dependency for dependency in dependencies if not dependency.get('clientside_function')]
+
+
+def input_options(props):
+    return {
+        id_: [option['value'] for option in props[id_].get('options', [])]
+        for id_ in ACTIONS if id_ in props
+    }
+
+
+# SESSIONS
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, kind, elapsed_ms, ok):
+        with self._lock:
+            self.samples.append((kind, elapsed_ms, ok))
+
+
+class Session:
+    """One browser tab: a keep-alive connection, and the page state the renderer would hold."""
+
+    def __init__(self, url, recorder, think_time, rng):
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.prefix = parsed.path.rstrip('/')
+        self.recorder = recorder
+        self.think_time = think_time
+        self.rng = rng
+        self.connection = None
+
+    def request(self, kind, method, path, body=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            ok = response.status in (200, 204)
+        except (OSError, http.client.HTTPException):
+            self.close()
+            data, ok = None, False
+        self.recorder.add(kind, (time.perf_counter() - start) * 1000, ok)
+        return data if ok else None
+
+    def request_json(self, kind, method, path, body=None):
+        data = self.request(kind, method, path, body)
+        if not data:
+            return None
+        if data[:2] == b'\x1f\x8b':
+            data = gzip.decompress(data)
+        return json.loads(data)
+
+    def fire(self, callbacks, props, changed_id):
+        for dependency in callbacks:
+            input_ids = [item['id'] for item in dependency['inputs']]
+            if changed_id is not None and changed_id not in input_ids:
+                continue
+            changed = ['{}.{}'.format(item['id'], item['property']) for item in dependency['inputs']]
+            if changed_id is not None:
+                changed = [prop_id for prop_id in changed if prop_id.startswith(changed_id + '.')]
+            elif dependency.get('prevent_initial_call'):
+                continue
+            self.request_json(
+                'callback:' + dependency['output'], 'POST', '/_dash-update-component',
+                callback_body(dependency, props, changed),
+            )
+
+    def run(self, deadline):
+        # Page load, then input changes until the deadline
+        self.request('index', 'GET', '/')
+        layout = self.request_json('layout', 'GET', '/_dash-layout')
+        dependencies = self.request_json('dependencies', 'GET', '/_dash-dependencies')
+        if layout is None or dependencies is None:
+            return
+        props = component_props(layout)
+        # The map's animation frames are fetched once the page has loaded
+        frames_url = props.get('map-frames-url', {}).get('data')
+        if frames_url:
+            self.request('map_frames', 'GET', frames_url)
+        callbacks = server_callbacks(dependencies)
+        options = input_options(props)
+        self.fire(callbacks, props, None)
+
+        ids, weights = zip(*[(id_, weight) for id_, weight in ACTIONS.items() if options.get(id_)])
+        while time.monotonic() < deadline:
+            time.sleep(self.rng.expovariate(1 / self.think_time) if self.think_time > 0 else 0)
+            id_ = self.rng.choices(ids, weights)[0]
+            props[id_]['value'] = self.rng.choice(options[id_])
+            self.fire(callbacks, props, id_)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def run_level(url, concurrency, duration, think_time, seed):
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+
+    def worker(i):
+        rng = random.Random(seed * 1000003 + i)
+        # A new session (page load) whenever the previous one ends, like visitors coming and going
+        while time.monotonic() < deadline:
+            session = Session(url, recorder, think_time, rng)
+            try:
+                session.run(min(deadline, time.monotonic() + rng.uniform(duration / 4, duration)))
+            finally:
+                session.close()
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(recorder.samples, time.monotonic() - start)
+
+
+def summarize(samples, elapsed):
+    def stats(rows):
+        timings = [elapsed_ms for _, elapsed_ms, _ in rows]
+        errors = sum(1 for _, _, ok in rows if not ok)
+        return {
+            'requests': len(rows),
+            'throughput_rps': len(rows) / elapsed,
+            'error_rate': errors / len(rows),
+            'p50_ms': float(np.percentile(timings, 50)),
+            'p95_ms': float(np.percentile(timings, 95)),
+            'p99_ms': float(np.percentile(timings, 99)),
+            'max_ms': float(np.max(timings)),
+        }
+
+    if not samples:
+        return {'requests': 0}
+    kinds = sorted({kind for kind, _, _ in samples})
+    summary = stats(samples)
+    summary['by_request'] = {kind: stats([row for row in samples if row[0] == kind]) for kind in kinds}
+    return summary
+
+
+# LOCAL INSTANCE
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout):
+    parsed = urllib.parse.urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The app exited with status {}'.format(process.returncode))
+        try:
+            connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=5)
+            connection.request('GET', '/_dash-layout')
+            if connection.getresponse().status == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError('The app did not start within {} seconds'.format(timeout))
+
+
+def start_app(tmp, args):
+    sys.path.insert(0, ROOT)
+    from benchmarks import synthetic
+
+    csv_path = synthetic.write_csv(os.path.join(tmp, 'vaccinations.csv'), args.countries, args.days)
+    env = dict(
+        os.environ,
+        CETM25_DATA_SOURCE=csv_path,
+        CETM25_CACHE_DIR=os.path.join(tmp, 'cache'),
+        CETM25_CLIENTSIDE='0' if args.server_callbacks else os.environ.get('CETM25_CLIENTSIDE', '1'),
+    )
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, os.path.join(ROOT, 'serve.py'),
+            '--bind', '127.0.0.1:{}'.format(port),
+            '--workers', str(args.workers),
+            '--threads', str(args.threads),
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    url = 'http://127.0.0.1:{}'.format(port)
+    try:
+        wait_until_up(url, process, args.startup_timeout)
+    except Exception:
+        process.terminate()
+        raise
+    return url, process
+
+
+def run(args):
+    levels = [int(level) for level in args.concurrency.split(',')]
+    with tempfile.TemporaryDirectory() as tmp:
+        process = None
+        url = args.url
+        if args.start:
+            url, process = start_app(tmp, args)
+        try:
+            results = {}
+            for level in levels:
+                results[str(level)] = run_level(url, level, args.duration, args.think_time, args.seed)
+                print('concurrency {}: {:.1f} req/s, p99 {:.1f} ms, {:.2%} errors'.format(
+                    level,
+                    results[str(level)].get('throughput_rps', 0),
+                    results[str(level)].get('p99_ms', 0),
+                    results[str(level)].get('error_rate', 0),
+                ), file=sys.stderr)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    return {
+        'meta': {
+            'url': url if not args.start else 'local',
+            'workers': args.workers if args.start else None,
+            'threads': args.threads if args.start else None,
+            'duration_s': args.duration,
+            'think_time_s': args.think_time,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8050', help='instance to load, unless --start is given')
+    parser.add_argument('--start', action='store_true', help='start the app under serve.py on a synthetic CSV')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--countries', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument(
+        '--server-callbacks',
+        action='store_true',
+        help='start the app with CETM25_CLIENTSIDE=0, so that every callback is sent to the server',
+    )
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--concurrency', default='1,4,16,64', help='comma-separated numbers of sessions')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per concurrency level')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean seconds between input changes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Benchmark the data load, cleaning pipeline, figure builds and every server callback.
+
+Run from the repository root, for example:
+
+    python -m benchmarks.run --countries 200 --days 365 --output bench.json
+
+Everything runs against a synthetic CSV in a temporary directory, so no network access is needed.
+Results are p50/p95 latency in milliseconds and peak traced memory in bytes, one entry per stage.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Memory is traced in a separate run, since tracing slows everything down
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'runs': repeat,
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'mean_ms': float(np.mean(timings)),
+        'peak_memory_bytes': peak,
+    }
+
+
+def callback_request(app, output_ids, inputs):
+    # Body of a _dash-update-component request, as sent by the Dash renderer
+    outputs = [output.split('.') for output in output_ids]
+    if len(outputs) == 1:
+        output = output_ids[0]
+        outputs_body = {'id': outputs[0][0], 'property': outputs[0][1]}
+    else:
+        output = '..' + '...'.join(output_ids) + '..'
+        outputs_body = [{'id': id_, 'property': prop} for id_, prop in outputs]
+    assert output in app.callback_map, 'No server callback for {}'.format(output)
+    return {
+        'output': output,
+        'outputs': outputs_body,
+        'inputs': [
+            {'id': id_, 'property': prop, 'value': value}
+            for (id_, prop), value in inputs
+        ],
+        'changedPropIds': ['{}.{}'.format(id_, prop) for (id_, prop), _ in inputs],
+        'state': [],
+    }
+
+
+def post_callback(client, body):
+    response = client.post('/_dash-update-component', json=body)
+    assert response.status_code in (200, 204), response.status_code
+    return response
+
+
+def run(n_countries, n_days, repeat):
+    sys.path.insert(0, ROOT)
+    import pandas as pd
+    import plotly
+
+    from benchmarks import synthetic
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = synthetic.write_csv(os.path.join(tmp, 'vaccinations.csv'), n_countries, n_days)
+
+        # The app reads its data and callback mode from the environment at import
+        os.environ['CETM25_DATA_SOURCE'] = csv_path
+        os.environ['CETM25_CACHE_DIR'] = os.path.join(tmp, 'cache')
+        os.environ['CETM25_CLIENTSIDE'] = '0'
+
+        import data_source
+        import figures
+        from dashboard_config import load_config
+        from dataset import (
+            build_dataset,
+            choropleth_rows,
+            clean,
+            grid_rows,
+            pivot_dates,
+        )
+
+        config = load_config()
+        with open(csv_path, 'rb') as fh:
+            raw = fh.read()
+
+        results['read_csv'] = measure(lambda: pd.read_csv(csv_path), repeat)
+        results['parse_csv_pruned'] = measure(lambda: data_source.parse_csv(raw), repeat)
+
+        frame = data_source.parse_csv(raw)
+        results['clean_ffill'] = measure(lambda: clean(frame), repeat)
+        df = clean(frame)
+        df_final = grid_rows(df, config.dates)
+        results['filter_pivot'] = measure(lambda: pivot_dates(grid_rows(df, config.dates), config.dates), repeat)
+
+        snapshot = data_source.Snapshot(frame, 'bench')
+        results['build_dataset'] = measure(lambda: build_dataset(snapshot, config), repeat)
+        dataset = build_dataset(snapshot, config)
+        df_choropleth = choropleth_rows(df_final, config)
+
+        range_x = [config.dates[0], config.dates[-1]]
+        results['px_line'] = measure(
+            lambda: figures.build_line_figure(dataset.df_total_vacs, range_x, config.region_colors), repeat,
+        )
+        results['px_choropleth'] = measure(lambda: figures.build_choropleth_figure(df_choropleth), repeat)
+
+        start = time.perf_counter()
+        app_module = importlib.import_module('CETM25_visualisation_app')
+        import_ms = (time.perf_counter() - start) * 1000
+        results['app_import'] = {'runs': 1, 'p50_ms': import_ms, 'p95_ms': import_ms, 'mean_ms': import_ms}
+
+        app = app_module.app
+        client = app.server.test_client()
+        results['layout'] = measure(lambda: client.get('/_dash-layout'), repeat)
+
+        range_ends = [option['value'] for option in config.range_options]
+        tags = ['tag{}.children'.format(i + 1) for i in range(len(config.regions))]
+        callbacks = {
+            'update_graph': (['line_graph.figure'], [('my-dropdown', 'value')], range_ends),
+            'update_tags': (tags, [('my-dropdown', 'value')], range_ends),
+            'update_output': (['my-markdown.children'], [('my-radio', 'value')], app_module.annotations),
+            'update_footnote': (['my-footnote.children'], [('my-radioitem2', 'value')], app_module.footnote),
+        }
+        for name, (outputs, input_ids, values) in callbacks.items():
+            bodies = [
+                callback_request(app, outputs, [(input_id, value) for input_id in input_ids])
+                for value in values
+            ]
+            counter = iter(range(sys.maxsize))
+            results['callback:' + name] = measure(
+                lambda: post_callback(client, bodies[next(counter) % len(bodies)]), repeat,
+            )
+
+    return {
+        'meta': {
+            'countries': n_countries,
+            'days': n_days,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'plotly': plotly.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--countries', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = json.dumps(run(args.countries, args.days, args.repeat), indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
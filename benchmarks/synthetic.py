@@ -0,0 +1,84 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from dashboard_config import (
+    AFRICA,
+    EUROPE,
+)
+
+# Columns of the real 'country vaccinations.csv', so that column pruning is part of what is measured
+SOURCE_COLUMNS = [
+    'country', 'iso_code', 'date', 'total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated',
+    'daily_vaccinations_raw', 'daily_vaccinations', 'total_vaccinations_per_hundred',
+    'people_vaccinated_per_hundred', 'people_fully_vaccinated_per_hundred', 'daily_vaccinations_per_million',
+    'vaccines', 'source_name', 'source_website',
+]
+
+
+def country_names(n_countries):
+    # Real African and European names first so that the configured regions have data
+    names = AFRICA + EUROPE
+    return (names + ['Country {}'.format(i) for i in range(len(names), n_countries)])[:n_countries]
+
+
+def iso_code(i):
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return 'X' + letters[i // 26 % 26] + letters[i % 26] + ('' if i < 676 else str(i // 676))
+
+
+def generate(n_countries, n_days, start='2021-01-01', missing=0.3, seed=0):
+    """Synthetic vaccinations frame, N countries x M days, sorted by country then date.
+
+    Cumulative counts grow at a random per-country rate, with a fraction of readings missing so
+    that the per-country forward-fill has work to do.
+    """
+    rng = np.random.default_rng(seed)
+    countries = country_names(n_countries)
+    dates = pd.date_range(start, periods=n_days, freq='D').strftime('%Y-%m-%d')
+
+    daily = rng.gamma(2.0, rng.uniform(10, 50000, size=(n_countries, 1)), size=(n_countries, n_days))
+    vaccinated = np.cumsum(daily, axis=1)
+    fully = np.floor(vaccinated * 0.6)
+    fully[rng.random(fully.shape) < missing] = np.nan
+
+    size = n_countries * n_days
+    return pd.DataFrame({
+        'country': np.repeat(countries, n_days),
+        'iso_code': np.repeat([iso_code(i) for i in range(n_countries)], n_days),
+        'date': np.tile(dates, n_countries),
+        'total_vaccinations': np.floor(vaccinated * 1.4).ravel(),
+        'people_vaccinated': np.floor(vaccinated).ravel(),
+        'people_fully_vaccinated': fully.ravel(),
+        'daily_vaccinations_raw': np.floor(daily).ravel(),
+        'daily_vaccinations': np.floor(daily).ravel(),
+        'total_vaccinations_per_hundred': np.round(rng.random(size) * 100, 2),
+        'people_vaccinated_per_hundred': np.round(rng.random(size) * 100, 2),
+        'people_fully_vaccinated_per_hundred': np.round(rng.random(size) * 100, 2),
+        'daily_vaccinations_per_million': np.floor(rng.random(size) * 10000),
+        'vaccines': 'Oxford/AstraZeneca, Pfizer/BioNTech',
+        'source_name': 'Ministry of Health',
+        'source_website': 'https://example.org/',
+    }, columns=SOURCE_COLUMNS)
+
+
+def write_csv(path, n_countries, n_days, **kwargs):
+    generate(n_countries, n_days, **kwargs).to_csv(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic country vaccinations CSV.')
+    parser.add_argument('path')
+    parser.add_argument('--countries', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--start', default='2021-01-01')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_csv(args.path, args.countries, args.days, start=args.start, seed=args.seed)
+    print('Wrote {} ({} countries x {} days)'.format(args.path, args.countries, args.days))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+import collections
+import functools
+import hashlib
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+# Sentinel for a missing value, since None is a valid callback output
+MISSING = object()
+
+
+class LRUCache:
+    """Bounded, thread-safe least-recently-used cache with hit/miss counters.
+
+    Entries expire after `ttl` seconds when it is set.
+    """
+
+    def __init__(self, maxsize=32, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_build(self, key, build):
+        # Built outside the lock, so two concurrent misses may both build; the last one wins
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = build()
+            self.put(key, value)
+        return value
+
+    def evict(self, predicate):
+        # Drop every entry whose key matches, e.g. those built from an older data version
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# SHARED BACKENDS
+
+# These share entries between worker processes. Keys are strings and values are anything JSON can
+# encode, which covers Dash callback outputs. A backend that fails is treated as a miss, so the cache
+# can never take a callback down with it.
+
+class DiskCache:
+    """One JSON file per entry in `directory`, evicting the least recently used once the directory
+    grows past `max_bytes`.
+    """
+
+    # How many writes go by between checks of the directory's size
+    SIZE_CHECK_EVERY = 64
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path) as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            self.misses += 1
+            return default
+        if entry['expires'] is not None and entry['expires'] < time.time():
+            _remove(path)
+            self.misses += 1
+            return default
+        # The access time is what eviction goes by, so it is set explicitly
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+        self.hits += 1
+        return entry['value']
+
+    def put(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        entry = {'expires': time.time() + ttl if ttl else None, 'value': value}
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(entry, fh, separators=(',', ':'))
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            logger.warning('Callback cache write failed', exc_info=True)
+            return
+        self._writes += 1
+        if self._writes % self.SIZE_CHECK_EVERY == 0:
+            self.trim()
+
+    def trim(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                _remove(entry.path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """Minimal client for the Redis protocol (RESP2), with one connection per thread.
+
+    Only what the cache needs is used (GET, SET with EX, SCAN, DEL), so any server speaking the
+    protocol works, including a local stand-in.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, timeout=1.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        parsed = urllib.parse.urlparse(url)
+        return cls(
+            host=parsed.hostname or 'localhost',
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip('/') or 0),
+            password=parsed.password,
+            **kwargs
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+            if self.password:
+                self._call(conn, 'AUTH', self.password)
+            if self.db:
+                self._call(conn, 'SELECT', self.db)
+        return conn
+
+    def execute(self, *args):
+        try:
+            return self._call(self._connection(), *args)
+        except (OSError, RespError):
+            self.close()
+            raise
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+
+    def _call(self, conn, *args):
+        sock, reader = conn
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        sock.sendall(b''.join(parts))
+        return _read_reply(reader)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise RespError('Connection closed')
+    prefix, rest = line[:1], line[1:-2]
+    if prefix == b'+':
+        return rest.decode()
+    if prefix == b'-':
+        raise RespError(rest.decode())
+    if prefix == b':':
+        return int(rest)
+    if prefix == b'$':
+        length = int(rest)
+        if length == -1:
+            return None
+        return reader.read(length + 2)[:-2]
+    if prefix == b'*':
+        length = int(rest)
+        if length == -1:
+            return None
+        return [_read_reply(reader) for _ in range(length)]
+    raise RespError('Unexpected reply {!r}'.format(line))
+
+
+class RedisCache:
+    """Entries stored in a Redis-protocol server under `prefix`.
+
+    Expiry is the server's (SET ... EX) and size-based eviction is its maxmemory policy.
+    """
+
+    def __init__(self, client, prefix='cetm25:', ttl=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            data = self.client.execute('GET', self.prefix + key)
+        except (OSError, RespError):
+            logger.warning('Callback cache GET failed', exc_info=True)
+            data = None
+        if data is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(data)
+
+    def put(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        args = ['SET', self.prefix + key, json.dumps(value, separators=(',', ':'))]
+        if ttl:
+            args += ['EX', int(max(ttl, 1))]
+        try:
+            self.client.execute(*args)
+        except (OSError, RespError):
+            logger.warning('Callback cache SET failed', exc_info=True)
+
+    def clear(self):
+        cursor = '0'
+        while True:
+            cursor, keys = self.client.execute('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 500)
+            if keys:
+                self.client.execute('DEL', *keys)
+            cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+            if cursor == '0':
+                break
+
+
+def cache_from_url(url, ttl=None, maxsize=256):
+    """`memory` (the default), `disk:<directory>` or `redis://[:password@]host[:port][/db]`."""
+    if not url or url == 'memory':
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    if url.startswith('disk:'):
+        return DiskCache(url[len('disk:'):], ttl=ttl)
+    if url.startswith('redis://'):
+        return RedisCache(RespClient.from_url(url), ttl=ttl)
+    raise ValueError('Unknown cache backend {!r}'.format(url))
+
+
+# CALLBACK MEMOIZATION
+
+def cached_callback(cache, callback_id, version):
+    """Memoize a callback on its id, its inputs and the data version returned by `version()`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            inputs = json.dumps(args, sort_keys=True, separators=(',', ':'), default=str)
+            key = '{}:{}:{}'.format(callback_id, version(), hashlib.sha1(inputs.encode()).hexdigest())
+            value = cache.get(key, MISSING)
+            if value is MISSING:
+                value = fn(*args)
+                cache.put(key, value)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,120 @@
+import collections
+import functools
+import hashlib
+import json
+import os
+
+Region = collections.namedtuple('Region', ['name', 'countries', 'color', 'card_class'])
+
+AFRICA = [
+    'Algeria', 'Angola', 'Benin', 'Botswana', 'Burkina Faso', 'Cameroon', 'Cape Verde', 'Central African Republic',
+    'Chad', 'Comoros', 'Congo', "Cote d'Ivoire", 'Democratic Republic of the Congo', 'Djibouti', 'Egypt',
+    'Equatorial Guinea', 'Eswatini', 'Ethiopia', 'Gabon', 'Gambia', 'Ghana', 'Guinea', 'Guinea-Bissau', 'Kenya',
+    'Lesotho', 'Libya', 'Liberia', 'Madagascar', 'Malawi', 'Mali', 'Mauritania', 'Mauritius', 'Morocco', 'Mozambique',
+    'Namibia', 'Niger', 'Nigeria', 'Rwanda', 'Saint Helena', 'Sao Tome and Principe', 'Senegal', 'Seychelles',
+    'Sierra Leone', 'Somalia', 'South Africa', 'Sudan', 'Togo', 'Tunisia', 'Uganda', 'Zambia', 'Zimbabwe'
+]
+
+EUROPE = [
+    'Andorra', 'Albania', 'Austria', 'Azerbaijan', 'Belarus', 'Belgium', 'Bosnia and Herzegovina', 'Bulgaria',
+    'Croatia', 'Cyprus', 'Czechia', 'Denmark', 'Estonia', 'Faeroe Islands', 'Finland', 'France', 'Georgia', 'Germany',
+    'Gibraltar', 'Greece', 'Guernsey', 'Hungary', 'Iceland', 'Ireland', 'Isle of Man', 'Italy', 'Jersey', 'Kosovo',
+    'Latvia', 'Liechtenstein', 'Lithuania', 'Luxembourg', 'Malta', 'Moldova', 'Monaco', 'Montenegro', 'Netherlands',
+    'North Macedonia', 'Northern Cyprus', 'Norway', 'Poland', 'Portugal', 'Romania', 'San Marino', 'Serbia', 'Slovakia',
+    'Slovenia', 'Spain', 'Sweden', 'Switzerland', 'Turkey', 'Ukraine', 'United Kingdom',
+]
+
+# Any of these can be overridden by a JSON file named in CETM25_CONFIG
+DEFAULTS = {
+    'date_start': '2021-01-15',
+    'date_end': '2021-04-15',
+    # Pandas frequency of the date grid, SMS-15 is the 1st and 15th of each month
+    'date_freq': 'SMS-15',
+    # Months between the end dates offered by the 'Filter by Month' dropdown
+    'range_step_months': 1,
+    'regions': [
+        {'name': 'Africa', 'countries': AFRICA, 'color': 'red', 'card_class': 'border-danger'},
+        {'name': 'Europe', 'countries': EUROPE, 'color': 'blue', 'card_class': 'border-primary'},
+    ],
+}
+
+ORDINALS = [
+    'First', 'Second', 'Third', 'Fourth', 'Fifth', 'Sixth', 'Seventh', 'Eighth', 'Ninth', 'Tenth', 'Eleventh',
+    'Twelfth',
+]
+
+
+class DashboardConfig:
+    """The date grid and the regions the dashboard is built over.
+
+    The date grid and the range options are computed on first use, as they need pandas.
+    """
+
+    def __init__(self, date_start, date_end, date_freq, range_step_months, regions):
+        self.date_start = date_start
+        self.date_end = date_end
+        self.date_freq = date_freq
+        self.range_step_months = range_step_months
+        self.regions = [Region(**region) for region in regions]
+
+        # Every region's countries, in order and without duplicates
+        self.countries = list(dict.fromkeys(
+            country for region in self.regions for country in region.countries
+        ))
+
+    @functools.cached_property
+    def dates(self):
+        import pandas as pd
+
+        grid = pd.date_range(self.date_start, self.date_end, freq=self.date_freq)
+        return list(grid.strftime('%Y-%m-%d'))
+
+    @functools.cached_property
+    def range_options(self):
+        import pandas as pd
+
+        steps = pd.date_range(self.date_start, self.date_end, freq=pd.DateOffset(months=self.range_step_months))[1:]
+        range_ends = [date for date in steps.strftime('%Y-%m-%d') if date in self.dates] or self.dates[-1:]
+        return [
+            {'label': month_label(i), 'value': date}
+            for i, date in enumerate(range_ends)
+        ]
+
+    @property
+    def region_names(self):
+        return [region.name for region in self.regions]
+
+    @property
+    def region_countries(self):
+        return {region.name: region.countries for region in self.regions}
+
+    @property
+    def region_colors(self):
+        return {region.name: region.color for region in self.regions}
+
+    @property
+    def digest(self):
+        # Identifies the configuration, for stores of what is built from it
+        options = {
+            'date_start': self.date_start,
+            'date_end': self.date_end,
+            'date_freq': self.date_freq,
+            'range_step_months': self.range_step_months,
+            'regions': [region._asdict() for region in self.regions],
+        }
+        return hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def month_label(i):
+    if i < len(ORDINALS):
+        return '{} Month'.format(ORDINALS[i])
+    return 'Month {}'.format(i + 1)
+
+
+def load_config(path=None):
+    options = dict(DEFAULTS)
+    path = path or os.environ.get('CETM25_CONFIG')
+    if path:
+        with open(path) as fh:
+            options.update(json.load(fh))
+    return DashboardConfig(**options)
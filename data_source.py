@@ -0,0 +1,217 @@
+import collections
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SOURCE = 'https://raw.githubusercontent.com/GiselleVicatos/Sunderland_CETM25/main/country%20vaccinations.csv'
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.snapshot_cache')
+
+# Only the columns used by the dashboard are kept in the snapshot
+COLUMNS = [
+    'country',
+    'iso_code',
+    'date',
+    'people_fully_vaccinated',
+]
+
+DTYPES = {
+    'country': str,
+    'iso_code': str,
+    'date': str,
+    'people_fully_vaccinated': 'float64',
+}
+
+# Bump this whenever the on-disk layout changes so that older snapshots are ignored
+SNAPSHOT_FORMAT = 3
+
+MANIFEST = 'manifest.json'
+
+# frame is the column-pruned DataFrame, version identifies the source content it was built from
+Snapshot = collections.namedtuple('Snapshot', ['frame', 'version'])
+
+
+def is_url(source):
+    return source.startswith(('http://', 'https://'))
+
+
+def load_snapshot(source=None, cache_dir=None, refresh=None):
+    """Return the vaccinations data, using the local snapshot when it is still valid.
+
+    Local files are revalidated by mtime and size, and only re-hashed when those change. URLs are
+    only downloaded when no snapshot exists yet or a refresh is requested, so a worker can start
+    without network access once the snapshot has been written.
+    """
+    source = source or default_source()
+    cache_dir = cache_dir or os.environ.get('CETM25_CACHE_DIR', DEFAULT_CACHE_DIR)
+    if refresh is None:
+        refresh = os.environ.get('CETM25_REFRESH_DATA', '') not in ('', '0')
+
+    manifest = _read_manifest(cache_dir)
+    entry = manifest.get(source)
+    stamp = _source_stamp(source)
+
+    if entry is not None and not refresh:
+        if stamp is None or stamp == (entry['mtime'], entry['size']):
+            frame = _read_snapshot(cache_dir, entry['key'])
+            if frame is not None:
+                return Snapshot(frame, entry['key'])
+
+    data = _read_source(source)
+    key = '{}-v{}'.format(hashlib.sha256(data).hexdigest()[:16], SNAPSHOT_FORMAT)
+
+    # The content may be unchanged even though the file was touched
+    frame = _read_snapshot(cache_dir, key)
+    if frame is None:
+        frame = parse_csv(data)
+        _write_snapshot(cache_dir, key, frame)
+
+    mtime, size = stamp if stamp is not None else (None, len(data))
+    manifest[source] = {'key': key, 'mtime': mtime, 'size': size}
+    _write_manifest(cache_dir, manifest)
+    # The source's previous snapshot is no longer referenced. Processes that still have it mapped keep
+    # their pages; where open files cannot be removed it is left for the next refresh.
+    if entry is not None and entry['key'] != key and entry['key'] not in {e['key'] for e in manifest.values()}:
+        shutil.rmtree(os.path.join(cache_dir, entry['key']), ignore_errors=True)
+    return Snapshot(frame, key)
+
+
+def default_source():
+    return os.environ.get('CETM25_DATA_SOURCE', DEFAULT_SOURCE)
+
+
+def load_new_rows(since, source=None, chunksize=100000):
+    # Rows dated after `since`, streamed from the source for an incremental ingest. ISO dates compare
+    # correctly as strings.
+    since = pd.Timestamp(since).strftime('%Y-%m-%d')
+    with local_copy(source) as (path, _):
+        parts = [chunk.loc[chunk['date'] > since] for chunk in iter_chunks(path, chunksize)]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+
+
+def iter_chunks(path, chunksize):
+    # Only the used columns are parsed, with explicit dtypes, chunksize rows at a time
+    for chunk in pd.read_csv(path, usecols=COLUMNS, dtype=DTYPES, chunksize=chunksize):
+        yield chunk[COLUMNS]
+
+
+@contextlib.contextmanager
+def local_copy(source=None, block_size=1 << 20):
+    """Yield a local path to the source and the hash of its content, without holding it in memory.
+
+    URLs are downloaded to a temporary file, hashing each block as it arrives.
+    """
+    source = source or default_source()
+    digest = hashlib.sha256()
+    if not is_url(source):
+        with open(source, 'rb') as fh:
+            for block in iter(lambda: fh.read(block_size), b''):
+                digest.update(block)
+        yield source, 'stream-' + digest.hexdigest()[:16]
+        return
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'wb') as out, urllib.request.urlopen(source) as response:
+            for block in iter(lambda: response.read(block_size), b''):
+                digest.update(block)
+                out.write(block)
+        yield tmp_path, 'stream-' + digest.hexdigest()[:16]
+    finally:
+        os.remove(tmp_path)
+
+
+def parse_csv(data):
+    frame = pd.read_csv(io.BytesIO(data), usecols=COLUMNS, dtype=DTYPES)
+    return frame[COLUMNS]
+
+
+def _source_stamp(source):
+    if is_url(source):
+        return None
+    stat = os.stat(source)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_source(source):
+    if is_url(source):
+        with urllib.request.urlopen(source) as response:
+            return response.read()
+    with open(source, 'rb') as fh:
+        return fh.read()
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache_dir, manifest):
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(tmp_path, os.path.join(cache_dir, MANIFEST))
+
+
+# SNAPSHOT LAYOUT
+
+# One .npy file per column so that every column can be memory-mapped on load. Country and ISO code are
+# stored as categoricals: integer codes (-1 where missing) and a small array of the categories. Dates are
+# stored parsed, as datetime64[ns] with NaT where missing, which pandas uses as they are.
+
+STRING_COLUMNS = ('country', 'iso_code')
+
+
+def _read_snapshot(cache_dir, key):
+    path = os.path.join(cache_dir, key)
+    if not os.path.isdir(path):
+        return None
+    try:
+        parts = [_read_column(path, col) for col in COLUMNS]
+    except (OSError, ValueError):
+        return None
+    # A frame built from a dict of columns would copy them into a consolidated block, concatenating
+    # one-column frames keeps each column backed by its file
+    return pd.concat(parts, axis=1, copy=False)
+
+
+def _read_column(path, col):
+    if col in STRING_COLUMNS:
+        codes = np.load(os.path.join(path, col + '.codes.npy'), mmap_mode='r')
+        categories = np.load(os.path.join(path, col + '.categories.npy'))
+        return pd.DataFrame({col: pd.Categorical.from_codes(codes, categories=categories)}, copy=False)
+    values = np.load(os.path.join(path, col + '.npy'), mmap_mode='r')
+    return pd.DataFrame(values[:, None], columns=[col], copy=False)
+
+
+def _write_snapshot(cache_dir, key, frame):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=cache_dir, prefix='.' + key)
+    for col in COLUMNS:
+        if col in STRING_COLUMNS:
+            # The codes get the integer width pandas picks for the number of categories, so they
+            # are used as loaded
+            values = pd.Categorical(frame[col])
+            np.save(os.path.join(tmp_path, col + '.codes.npy'), values.codes)
+            np.save(os.path.join(tmp_path, col + '.categories.npy'), values.categories.to_numpy(dtype=str))
+        elif col == 'date':
+            values = pd.to_datetime(frame[col], format='%Y-%m-%d').to_numpy(dtype='datetime64[ns]')
+            np.save(os.path.join(tmp_path, col + '.npy'), values)
+        else:
+            np.save(os.path.join(tmp_path, col + '.npy'), frame[col].to_numpy(dtype='float64'))
+    try:
+        os.rename(tmp_path, os.path.join(cache_dir, key))
+    except OSError:
+        # Another worker published the same snapshot first
+        shutil.rmtree(tmp_path, ignore_errors=True)
@@ -0,0 +1,287 @@
+import copy
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import data_source
+from aggregates import (
+    ContinentAggregates,
+    membership_matrix,
+)
+from data_source import COLUMNS
+from derived import (
+    METRICS,
+    DerivedCube,
+)
+from series_index import (
+    CountrySeries,
+    block_from_frame,
+    fill_days,
+    scatter,
+)
+
+
+class Dataset:
+    """Everything the dashboard derives from one data snapshot."""
+
+    def __init__(self, version, config, df, df_pivot, df_choropleth, totals, last_date=None, last_values=None):
+        self.version = version
+        self.config = config
+        self.df_pivot = df_pivot
+        self.df_choropleth = df_choropleth
+        self.totals = totals
+        # Line graph needs a sum of vaccinations for the grid dates, in long format
+        self.df_total_vacs = totals.to_frame()
+        # Per-country daily series for the map drill-down, only available when the full frame was read.
+        # df itself is not kept: the series, the daily matrix and the cube hold all of it that is used.
+        self.series = CountrySeries.from_frame(df) if df is not None else None
+        # Region totals for every day, for the daily line graph, and the metrics derived from them
+        self.daily_totals, self.cube = self._derive_daily()
+        # Where the next incremental ingest picks up from. df is None when the data was streamed in
+        # chunks, in which case these are passed in.
+        self.last_date = df['date'].max() if last_date is None else last_date
+        self.last_values = carried_values(df) if last_values is None else last_values
+        # Digest of the version built from and every row appended since, see append
+        self._appended = version
+
+    def _derive_daily(self):
+        if self.series is None:
+            self._daily_matrix = None
+            return None, None
+        days, matrix = self.series.daily_matrix()
+        self._daily_matrix = days, matrix
+        totals = ContinentAggregates.from_daily(self.series.countries, days, matrix, self.config.region_countries)
+        cube = DerivedCube.from_matrix(self.series.countries, self.series.iso_codes, days, matrix, totals)
+        return totals, cube
+
+    def _extend_daily(self, block):
+        # Add the days of an appended block to the country x day matrix, the daily totals and the cube,
+        # deriving nothing for the days already there
+        days, matrix = self._daily_matrix
+        if not len(days) or not len(block.dates):
+            return self._derive_daily()
+        countries = self.series.countries
+        index = {country: i for i, country in enumerate(countries)}
+        new_days = np.arange(days[-1] + np.timedelta64(1, 'D'), block.dates.max() + np.timedelta64(1, 'D'))
+        extended = np.full((len(countries), len(days) + len(new_days)), np.nan)
+        extended[[index[country] for country in self.cube.countries], :len(days)] = matrix
+        scatter(extended, block, index, days[0])
+        # The last known day carries each country's value into the new ones
+        extended[:, len(days) - 1:] = fill_days(extended[:, len(days) - 1:])
+        self._daily_matrix = np.concatenate([days, new_days]), extended
+
+        membership = membership_matrix(np.asarray(countries, dtype=str), self.config.region_countries)
+        totals = ContinentAggregates(
+            self.daily_totals.continents,
+            self.daily_totals.dates + np.datetime_as_string(new_days).tolist(),
+            np.hstack([self.daily_totals.totals, membership @ np.nan_to_num(extended[:, len(days):])]),
+        )
+        cube = self.cube.extended(countries, self.series.iso_codes, extended, totals, len(days))
+        return totals, cube
+
+    def copy(self):
+        # append replaces the frames rather than modifying them, so only the totals, which it updates
+        # in place, need a real copy
+        new = copy.copy(self)
+        new.totals = self.totals.copy()
+        return new
+
+    def append(self, rows):
+        """Add rows newer than the data seen so far, without rerunning the whole pipeline.
+
+        Each country's forward-fill continues from its last known value. The pivot and the totals
+        are only updated for the grid dates the new rows touch, and those dates are returned. The
+        version only changes when some grid date does, so cached figures stay valid otherwise.
+        """
+        rows = compact(rows)
+        rows = rows.loc[rows['date'] > self.last_date]
+        if rows.empty:
+            return set()
+        rows = fill_forward(rows, self.last_values)
+        self._appended = hashlib.sha256(
+            self._appended.encode() + pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()
+        ).hexdigest()
+
+        if self.series is not None:
+            # The index, the daily matrix and the cube are extended by the new days only
+            block = block_from_frame(rows)
+            self.series = self.series.extend(block)
+            self.daily_totals, self.cube = self._extend_daily(block)
+        self.last_date = rows['date'].max()
+        self.last_values = carried_values(rows).combine_first(self.last_values)
+
+        new_final = grid_rows(rows, self.config.dates)
+        affected = set(new_final['date'].dt.strftime('%Y-%m-%d'))
+        if not affected:
+            return affected
+
+        self.df_choropleth = pd.concat(
+            [self.df_choropleth, choropleth_rows(new_final, self.config)],
+            ignore_index=True,
+        )
+
+        # Overwrite the touched cells, and add rows for countries that were not in the pivot yet
+        index = ['iso_code', 'country']
+        df_pivot = self.df_pivot.set_index(index)
+        new_pivot = pivot_dates(new_final, self.config.dates).set_index(index)
+        df_pivot.update(new_pivot)
+        df_pivot = pd.concat([df_pivot, new_pivot.loc[~new_pivot.index.isin(df_pivot.index)]])
+        self.df_pivot = df_pivot.reset_index()
+
+        dates = [date for date in self.config.dates if date in affected]
+        self.totals.update_from_pivot(self.df_pivot, self.config.region_countries, dates)
+        self.df_total_vacs = self.totals.to_frame()
+
+        # The version comes from the content, so processes that appended the same rows agree on it and
+        # ones that did not never share cached results through the disk or Redis callback caches
+        self.version = '{}+{}'.format(self.version.split('+')[0], self._appended[:16])
+        return affected
+
+
+# COMPACT REPRESENTATION
+
+# Country and ISO codes are categoricals, dates are datetime64 (day resolution, although pandas stores
+# them as ns) and the counts are nullable 32-bit integers, so the cleaned frames take a fraction of the
+# memory of object strings and float64.
+
+def compact(frame):
+    return pd.DataFrame({
+        'country': frame['country'].astype('category', copy=False),
+        'iso_code': frame['iso_code'].astype('category', copy=False),
+        'date': pd.to_datetime(frame['date'], format='%Y-%m-%d'),
+        'people_fully_vaccinated': frame['people_fully_vaccinated'].astype('float64', copy=False),
+    }, columns=COLUMNS)
+
+
+def downcast_counts(values):
+    # Counts are whole numbers, so they fit a nullable UInt32 unless the source has fractional or
+    # out of range values, in which case they are left as floats
+    present = values.dropna()
+    if present.empty or ((present % 1 == 0).all() and present.min() >= 0 and present.max() < 2 ** 32):
+        return values.astype('UInt32')
+    return values
+
+
+def carried_values(df):
+    # Each country's last known count, which the next incremental ingest or chunk carries forward
+    values = df.groupby('country', observed=True)['people_fully_vaccinated'].last().astype('float64')
+    values.index = values.index.astype(str)
+    return values
+
+
+def fill_forward(rows, carried):
+    # Per-country forward-fill that continues from each country's carried value
+    rows = rows.sort_values(['country', 'date'], kind='mergesort')
+    filled = rows.groupby('country', observed=True)['people_fully_vaccinated'].ffill()
+    previous = rows['country'].astype(str).map(carried).astype('float64')
+    return rows.assign(people_fully_vaccinated=downcast_counts(filled.fillna(previous)))
+
+
+def clean(frame):
+    df = compact(frame[COLUMNS])
+    # Replace null values with value in previous row, but grouped by country
+    filled = df.groupby('country', observed=True)['people_fully_vaccinated'].ffill()
+    df['people_fully_vaccinated'] = downcast_counts(filled)
+    return df
+
+
+def grid_rows(df, dates):
+    # Select specific dates in the month
+    return df.loc[df['date'].isin(pd.to_datetime(dates))]
+
+
+def pivot_dates(df_final, dates):
+    # Need to pivot dataframe so that each date is a column reading
+    df_pivot = df_final.pivot(
+        index=['iso_code', 'country'],
+        columns='date',
+        values='people_fully_vaccinated',
+    )
+    df_pivot = df_pivot.reindex(columns=pd.to_datetime(dates))
+    df_pivot.columns = list(dates)
+    return df_pivot.reset_index().rename_axis(None, axis=1)
+
+
+def choropleth_rows(df_final, config):
+    # Map only needs the configured regions' countries, with plain columns and dates formatted for the
+    # animation slider. This is a small frame, so it is given the types Plotly Express expects.
+    rows = df_final.loc[df_final['country'].isin(config.countries)]
+    return pd.DataFrame({
+        'country': rows['country'].astype(str),
+        'iso_code': rows['iso_code'].astype(str),
+        'date': rows['date'].dt.strftime('%d %b %Y'),
+        'people_fully_vaccinated': rows['people_fully_vaccinated'].astype('float64'),
+    })
+
+
+def metric_choropleth_rows(cube, config, metric):
+    # Like choropleth_rows, with a derived metric on each grid date in a column named after its label
+    countries = np.array(cube.countries)
+    keep = np.isin(countries, config.countries)
+    days = set(cube.days)
+    dates = [date for date in config.dates if date in days]
+    labels = pd.to_datetime(pd.Series(dates, dtype='object')).dt.strftime('%d %b %Y').tolist()
+    return pd.DataFrame({
+        'country': np.repeat(countries[keep], len(dates)),
+        'iso_code': np.repeat(np.array(cube.iso_codes)[keep], len(dates)),
+        'date': np.tile(labels, int(keep.sum())),
+        METRICS[metric]: cube.country_values(metric, dates)[keep].ravel(),
+    })
+
+
+def build_dataset(snapshot, config):
+    # Only the cleaned frame is kept, the snapshot's frame can be released by the caller
+    df = clean(snapshot.frame)
+    df_final = grid_rows(df, config.dates)
+    df_pivot = pivot_dates(df_final, config.dates)
+    totals = ContinentAggregates.from_pivot(df_pivot, config.region_countries, config.dates)
+    return Dataset(
+        version=snapshot.version,
+        config=config,
+        df=df,
+        df_pivot=df_pivot,
+        df_choropleth=choropleth_rows(df_final, config),
+        totals=totals,
+    )
+
+
+# CHUNKED INGEST
+
+def stream_dataset(source, config, chunksize, known_version=None):
+    """Build a dataset by reading the CSV `chunksize` rows at a time.
+
+    Only the four used columns are parsed, each chunk is forward-filled from the values carried
+    over from the previous ones, and only its grid-date rows are kept. Peak memory therefore
+    depends on the chunk size and the size of the grid, not on the size of the file. The full daily
+    frame is not read as a whole, so dataset.series is None. Returns None, without parsing, when the content hash is
+    still `known_version`.
+    """
+    carried = pd.Series(dtype='float64')
+    last_date = None
+    parts = []
+    with data_source.local_copy(source) as (path, version):
+        if version == known_version:
+            return None
+        for chunk in data_source.iter_chunks(path, chunksize):
+            rows = fill_forward(compact(chunk), carried)
+            carried = carried_values(rows).combine_first(carried)
+            chunk_last = rows['date'].max()
+            last_date = chunk_last if last_date is None or chunk_last > last_date else last_date
+            parts.append(grid_rows(rows, config.dates))
+
+    # The grid rows are few, so they are combined and pivoted in one go
+    df_final = compact(pd.concat(parts, ignore_index=True)) if parts else compact(pd.DataFrame(columns=COLUMNS))
+    df_final['people_fully_vaccinated'] = downcast_counts(df_final['people_fully_vaccinated'])
+    df_pivot = pivot_dates(df_final, config.dates)
+    totals = ContinentAggregates.from_pivot(df_pivot, config.region_countries, config.dates)
+    return Dataset(
+        version=version,
+        config=config,
+        df=None,
+        df_pivot=df_pivot,
+        df_choropleth=choropleth_rows(df_final, config),
+        totals=totals,
+        last_date=last_date,
+        last_values=carried,
+    )
@@ -0,0 +1,108 @@
+import numpy as np
+
+from aggregates import ContinentAggregates
+
+# Metric name -> label used on the charts
+METRICS = {
+    'cumulative': 'Fully vaccinated',
+    'daily': 'Daily increase',
+    'rolling_7d': 'Daily increase, 7-day average',
+    'wow_growth': 'Week-over-week growth',
+}
+
+WINDOW = 7
+
+
+def derive(matrix, window=WINDOW):
+    """Every metric of a row x day matrix of cumulative counts, as a metric x row x day array.
+
+    The daily increase is the difference between consecutive days, the rolling average is taken over
+    `window` full days of increases, and the growth compares that average with the one a window earlier.
+    Values that are not defined yet (the first days, or growth from zero) are NaN.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily = np.diff(matrix, axis=1, prepend=np.nan)
+
+        # Rolling sums from cumulative sums, counting the days that have an increase
+        valid = ~np.isnan(daily)
+        sums = np.cumsum(np.where(valid, daily, 0), axis=1)
+        counts = np.cumsum(valid, axis=1)
+        sums[:, window:] -= sums[:, :-window].copy()
+        counts[:, window:] -= counts[:, :-window].copy()
+        rolling = np.where(counts == window, sums / window, np.nan)
+
+        previous = np.full_like(rolling, np.nan)
+        previous[:, window:] = rolling[:, :-window]
+        growth = np.where(previous > 0, rolling / previous - 1, np.nan)
+    return np.stack([matrix, daily, rolling, growth])
+
+
+def color_range(values):
+    # 5th to 95th percentile, so that a few outliers do not wash out the map's colours
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return 0, 1
+    low, high = np.percentile(finite, [5, 95])
+    low = min(float(low), 0.0)
+    return low, float(high) if high > low else low + 1
+
+
+class DerivedCube:
+    """Every metric for every country and region on every day, computed in one pass per data version.
+
+    Countries and regions are kept apart, since the data has rows named after continents too.
+    """
+
+    def __init__(self, countries, iso_codes, regions, days, cube):
+        self.countries = list(countries)
+        self.iso_codes = list(iso_codes)
+        self.regions = list(regions)
+        self.days = list(days)
+        self.cube = cube
+        self.cube.setflags(write=False)
+        self._metric_index = {metric: i for i, metric in enumerate(METRICS)}
+        self._day_index = {day: j for j, day in enumerate(self.days)}
+        self._region_totals = {}
+
+    @classmethod
+    def from_matrix(cls, countries, iso_codes, days, matrix, region_totals):
+        # region_totals is the ContinentAggregates built from the same matrix
+        return cls(
+            countries,
+            iso_codes,
+            region_totals.continents,
+            region_totals.dates,
+            derive(np.vstack([matrix, region_totals.totals])),
+        )
+
+    def extended(self, countries, iso_codes, matrix, region_totals, first_new):
+        """The cube for a matrix that only differs from this one's in the days from column `first_new` on.
+
+        `countries` may include new ones. Only the new days are derived, from enough earlier days to
+        fill their windows; the earlier days are copied over.
+        """
+        stacked = np.vstack([matrix, region_totals.totals])
+        start = max(first_new - 2 * WINDOW - 1, 0)
+        fresh = derive(stacked[:, start:])[:, :, first_new - start:]
+        earlier = np.full((len(METRICS), stacked.shape[0], first_new), np.nan)
+        index = {country: i for i, country in enumerate(countries)}
+        earlier[:, [index[country] for country in self.countries], :] = self.cube[:, :len(self.countries)]
+        earlier[:, len(countries):, :] = self.cube[:, len(self.countries):]
+        return DerivedCube(
+            countries,
+            iso_codes,
+            region_totals.continents,
+            region_totals.dates,
+            np.concatenate([earlier, fresh], axis=2),
+        )
+
+    def country_values(self, metric, days):
+        columns = [self._day_index[day] for day in days]
+        return self.cube[self._metric_index[metric], :len(self.countries)][:, columns]
+
+    def region_totals(self, metric):
+        # The regions' rows as a ContinentAggregates, which the daily line graph is drawn from
+        if metric not in self._region_totals:
+            values = self.cube[self._metric_index[metric], len(self.countries):]
+            self._region_totals[metric] = ContinentAggregates(self.regions, self.days, values)
+        return self._region_totals[metric]
@@ -0,0 +1,73 @@
+"""Pick at most `n_out` of a series' points for plotting, keeping its visual shape.
+
+Both methods take evenly spaced values (the daily series) and return the sorted indices to keep, always
+including the first and last point.
+"""
+import numpy as np
+import pandas as pd
+
+
+def lttb(y, n_out):
+    # Largest-Triangle-Three-Buckets: from each bucket keep the point that forms the largest triangle
+    # with the point kept from the previous bucket and the average of the next one
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype='float64')
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64')
+    keep = np.empty(n_out, dtype='int64')
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a])
+            - (x[a] - x[start:stop]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def minmax(y, n_out):
+    # Keep each bucket's lowest and highest point, so spikes survive at any zoom level
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    buckets = max(n_out // 2, 1)
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.r_[0, order[starts], order[ends], n - 1])
+
+
+METHODS = {
+    'lttb': lttb,
+    'minmax': minmax,
+}
+
+
+def window_frame(totals, start, end, n_out, method='lttb'):
+    """Long-format frame of the daily totals between two dates, downsampled per continent.
+
+    totals is a ContinentAggregates over consecutive days. start and end may be Plotly axis values
+    such as '2021-02-03 12:00', only their date part is used.
+    """
+    dates = np.asarray(totals.dates)
+    # One extra day either side so that the lines reach the edges of the view
+    lo = max(int(np.searchsorted(dates, str(start)[:10], side='left')) - 1, 0)
+    hi = min(int(np.searchsorted(dates, str(end)[:10], side='right')) + 1, len(dates))
+    parts = []
+    for i, continent in enumerate(totals.continents):
+        # Derived metrics are NaN where undefined, which would throw off the point selection
+        keep = lo + METHODS[method](np.nan_to_num(totals.totals[i, lo:hi]), n_out)
+        parts.append(pd.DataFrame({
+            'Date': dates[keep],
+            'Continent': continent,
+            'Fully_Vaccinated_Number': totals.totals[i, keep],
+        }))
+    return pd.concat(parts, ignore_index=True)
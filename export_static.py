@@ -0,0 +1,291 @@
+"""Export the dashboard as a static bundle that needs no Python to serve.
+
+    python export_static.py dist/
+
+Every input of the dashboard takes one of a handful of values, so the layout is rendered to HTML
+once and every reachable callback output is computed up front: the Markdown for each RadioItems
+option, the line graph and card totals for each dropdown month, and the map for each metric. A small
+script swaps them in when an input changes. The bundle can be served by nginx or a CDN as plain files.
+The country drill-down follows clicks on any country, so it is left out.
+"""
+import argparse
+import html as html_escape
+import json
+import os
+import re
+
+from plotly.offline import get_plotlyjs
+
+SWITCHER_JS = r"""
+(function () {
+    function fetchJson(url) {
+        return fetch(url).then(function (response) { return response.json(); });
+    }
+
+    function setOutput(id, content) {
+        const element = document.getElementById(id);
+        if (content.figure) {
+            fetchJson(content.figure).then(function (figure) {
+                return Plotly.react(element, figure.data, figure.layout, {responsive: true});
+            }).then(function () {
+                if (content.frames) {
+                    fetchJson(content.frames).then(function (frames) {
+                        Plotly.addFrames(element, frames);
+                    });
+                }
+            });
+        } else if (content.html !== undefined) {
+            element.innerHTML = content.html;
+        } else {
+            element.textContent = content.text;
+        }
+    }
+
+    function apply(outputs, inputId, value) {
+        const targets = outputs.inputs[inputId][value];
+        Object.keys(targets).forEach(function (id) { setOutput(id, targets[id]); });
+    }
+
+    fetchJson('data/outputs.json').then(function (outputs) {
+        Object.keys(outputs.inputs).forEach(function (inputId) {
+            const element = document.getElementById(inputId);
+            element.addEventListener('change', function (event) {
+                apply(outputs, inputId, event.target.value);
+            });
+            apply(outputs, inputId, outputs.defaults[inputId]);
+        });
+    });
+})();
+"""
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<link rel="stylesheet" href="{stylesheet}">
+<script src="plotly.min.js"></script>
+</head>
+<body>
+{body}
+<script src="switcher.js"></script>
+</body>
+</html>
+"""
+
+# Components whose outputs cannot be computed up front
+OMITTED = {'country_graph'}
+
+
+# LAYOUT RENDERING
+
+# Dash components are rendered to the HTML their React counterparts produce, closely enough for the
+# Bootstrap classes and inline styles of this layout to apply
+
+def render(component):
+    if component is None:
+        return ''
+    if isinstance(component, (str, int, float)):
+        return html_escape.escape(str(component))
+    if isinstance(component, (list, tuple)):
+        return ''.join(render(child) for child in component)
+    if getattr(component, 'id', None) in OMITTED:
+        return ''
+
+    props = component.to_plotly_json()['props']
+    kind = (component._namespace, component._type)
+    children = render(props.get('children'))
+
+    if kind[0] == 'dash_html_components':
+        return element(kind[1].lower(), props, children)
+    if kind == ('dash_bootstrap_components', 'Container'):
+        return element('div', props, children, 'container-fluid' if props.get('fluid') else 'container')
+    if kind == ('dash_bootstrap_components', 'Row'):
+        return element('div', props, children, 'row')
+    if kind == ('dash_bootstrap_components', 'Col'):
+        return element('div', props, children, column_classes(props.get('width')))
+    if kind == ('dash_bootstrap_components', 'Card'):
+        if props.get('body'):
+            children = '<div class="card-body">{}</div>'.format(children)
+        return element('div', props, children, 'card')
+    if kind == ('dash_core_components', 'RadioItems'):
+        return radio_items(props)
+    if kind == ('dash_core_components', 'Dropdown'):
+        return dropdown(props)
+    if kind in (('dash_core_components', 'Markdown'), ('dash_core_components', 'Graph')):
+        return element('div', props, '')
+    if kind == ('dash_core_components', 'Store'):
+        return ''
+    raise ValueError('No static rendering for {}.{}'.format(*kind))
+
+
+def element(tag, props, children, extra_class=''):
+    attributes = []
+    if props.get('id'):
+        attributes.append(' id="{}"'.format(html_escape.escape(props['id'])))
+    classes = ' '.join(filter(None, [extra_class, props.get('className', '').strip()]))
+    if classes:
+        attributes.append(' class="{}"'.format(html_escape.escape(classes)))
+    if props.get('style'):
+        attributes.append(' style="{}"'.format(css(props['style'])))
+    return '<{tag}{attributes}>{children}</{tag}>'.format(tag=tag, attributes=''.join(attributes), children=children)
+
+
+def css(style):
+    def kebab(name):
+        return re.sub(r'([A-Z])', lambda match: '-' + match.group(1).lower(), name)
+    return html_escape.escape('; '.join('{}: {}'.format(kebab(key), value) for key, value in style.items()))
+
+
+def column_classes(width):
+    if width is None:
+        return 'col'
+    if isinstance(width, dict):
+        classes = ['col-{}'.format(width['size']) if 'size' in width else 'col']
+        if width.get('offset'):
+            classes.append('offset-{}'.format(width['offset']))
+        return ' '.join(classes)
+    return 'col-{}'.format(width)
+
+
+def radio_items(props):
+    # Option values are replaced by their index, which is how outputs.json refers to them
+    labels = []
+    for i, option in enumerate(props['options']):
+        checked = ' checked' if option['value'] == props.get('value') else ''
+        labels.append(element(
+            'label',
+            {'style': props.get('labelStyle', {}), 'className': props.get('labelClassName', '')},
+            '<input type="radio" name="{}" value="{}"{}> {}'.format(
+                html_escape.escape(props['id']), i, checked, html_escape.escape(option['label']),
+            ),
+        ))
+    return element('div', props, ''.join(labels))
+
+
+def dropdown(props):
+    options = ''.join(
+        '<option value="{}"{}>{}</option>'.format(
+            html_escape.escape(option['value']),
+            ' selected' if option['value'] == props.get('value') else '',
+            html_escape.escape(option['label']),
+        )
+        for option in props['options']
+    )
+    return element('select', dict(props, className='form-control'), options)
+
+
+def markdown(text):
+    # Just what the dashboard's texts use: headings, emphasis and paragraphs
+    blocks = []
+    for block in re.split(r'\n\s*\n', text.strip()):
+        block = html_escape.escape(' '.join(line.strip() for line in block.splitlines()))
+        block = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', block)
+        block = re.sub(r'\*(.+?)\*', r'<em>\1</em>', block)
+        heading = re.match(r'(#{1,6})\s+(.*)', block)
+        if heading:
+            level = len(heading.group(1))
+            blocks.append('<h{0}>{1}</h{0}>'.format(level, heading.group(2)))
+        elif block:
+            blocks.append('<p>{}</p>'.format(block))
+    return ''.join(blocks)
+
+
+# EXPORT
+
+def export(out_dir):
+    import dash_bootstrap_components as dbc
+
+    import CETM25_visualisation_app as dashboard
+    from figures import (
+        build_choropleth_figure,
+        split_frames,
+        to_figure_json,
+    )
+
+    state = dashboard.holder.current
+    config = state.config
+    data_dir = os.path.join(out_dir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+
+    def write_json(name, value):
+        with open(os.path.join(data_dir, name), 'w') as fh:
+            json.dump(value, fh, separators=(',', ':'))
+        return 'data/' + name
+
+    inputs = {
+        'my-radio': {
+            str(i): {'my-markdown': {'html': markdown(dashboard.update_output(text))}}
+            for i, text in enumerate(dashboard.annotations)
+        },
+        'my-radioitem2': {
+            str(i): {'my-footnote': {'html': markdown(dashboard.update_footnote(text))}}
+            for i, text in enumerate(dashboard.footnote)
+        },
+        'my-dropdown': {},
+    }
+    for i, option in enumerate(config.range_options):
+        value = option['value']
+        outputs = {'line_graph': {'figure': write_json('line_graph-{}.json'.format(i), dashboard.update_graph(value))}}
+        # update_tags is registered with app.callback, which expects Dash's request context, so the
+        # card totals are formatted here the same way
+        for j, name in enumerate(config.region_names):
+            total = state.queries['grid'].query(name, end=value)['end_value']
+            outputs['tag{}'.format(j + 1)] = {'text': '{:,.0f}'.format(total)}
+        inputs['my-dropdown'][value] = outputs
+
+    # The app's country shapes are only served by Flask, so the least detailed level is copied into the
+    # bundle and every map refers to it by a relative URL
+    geojson = None
+    if dashboard.geometry is not None:
+        level = dashboard.geometry.levels[0]
+        geojson = 'data/geo-{}.json'.format(level['name'])
+        with open(os.path.join(out_dir, geojson), 'wb') as fh:
+            fh.write(dashboard.geometry.payloads[level['name']].variants['identity'])
+
+    # The map for each metric is exported with all its frames, served separately as in the app's lazy mode
+    inputs['my-metric'] = {}
+    for option in dashboard.metric_options(state):
+        metric = option['value']
+        if metric == 'cumulative':
+            figure_json = to_figure_json(build_choropleth_figure(state.dataset.df_choropleth, geojson=geojson))
+        else:
+            figure_json = dashboard.build_metric_map(state, metric, geojson)
+        figure_map, frames = split_frames(figure_json)
+        inputs['my-metric'][metric] = {'map': {
+            'figure': write_json('map-{}.json'.format(metric), figure_map),
+            'frames': write_json('map-{}-frames.json'.format(metric), frames),
+        }}
+
+    write_json('outputs.json', {
+        'inputs': inputs,
+        'defaults': {
+            'my-radio': '0',
+            'my-radioitem2': '0',
+            'my-dropdown': config.range_options[-1]['value'],
+            'my-metric': 'cumulative',
+        },
+    })
+
+    with open(os.path.join(out_dir, 'plotly.min.js'), 'w') as fh:
+        fh.write(get_plotlyjs())
+    with open(os.path.join(out_dir, 'switcher.js'), 'w') as fh:
+        fh.write(SWITCHER_JS.lstrip())
+    with open(os.path.join(out_dir, 'index.html'), 'w') as fh:
+        fh.write(HTML_TEMPLATE.format(
+            title=html_escape.escape(dashboard.app.title),
+            stylesheet=dbc.themes.BOOTSTRAP,
+            body=render(dashboard.serve_layout()),
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out_dir', nargs='?', default='dist')
+    args = parser.parse_args()
+    export(args.out_dir)
+    print('Exported the dashboard to {}'.format(args.out_dir))
+
+
+if __name__ == '__main__':
+    main()
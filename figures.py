@@ -0,0 +1,161 @@
+import json
+
+# plotly_express is imported by the builders themselves: it is the slowest import of the app, and not
+# needed at all when the figures come from the figure store
+
+# Bump this whenever the figures built here change, so that figures stored by an older release are ignored
+FIGURE_FORMAT = 1
+
+LINE_TITLE = 'Total Number of Covid-19 Fully Vaccinated People in Europe Compared to Africa'
+
+
+def to_figure_json(fig):
+    # Serialize once through Plotly's encoder, keeping only plain JSON types so that Dash can
+    # send the result without touching Plotly again
+    return json.loads(fig.to_json())
+
+
+# LINE GRAPH
+
+def build_line_figure(df_total_vacs, range_x, colors, render_mode='auto', y_title='Number of fully vaccinated people'):
+    # render_mode='webgl' draws the lines with scattergl, for the daily series
+    import plotly_express as px
+
+    fig = px.line(
+        df_total_vacs,
+        x='Date',
+        y='Fully_Vaccinated_Number',
+        color='Continent',
+        markers=False,
+        range_x=range_x,
+        color_discrete_map=colors,
+        render_mode=render_mode,
+    )
+    fig.update_xaxes(
+        title_text='Date',
+        title_font={'size': 18},
+        showgrid=False,
+        tickformat='%d %b %Y',
+    )
+    fig.update_yaxes(
+        title_text=y_title,
+        title_font={'size': 18},
+        showgrid=False,
+    )
+    fig.update_layout(
+        title={
+            'text': LINE_TITLE,
+            'y': 1,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+        },
+        font_family='Calibri',
+        title_font_size=21,
+        margin={
+            'r': 100,
+            't': 50,
+            'l': 100,
+            'b': 50,
+        },
+    )
+    return fig
+
+
+# COUNTRY DRILL-DOWN
+
+COUNTRY_PLACEHOLDER = 'Click a country on the map to see its daily series'
+
+
+def build_country_figure(country, dates, values):
+    # dates and values are one country's slice of the series index; with no country selected the
+    # figure is an empty placeholder
+    import plotly_express as px
+
+    fig = px.line(
+        x=dates if country else [],
+        y=values if country else [],
+        labels={'x': 'Date', 'y': 'Number of fully vaccinated people'},
+    )
+    fig.update_xaxes(
+        showgrid=False,
+        tickformat='%d %b %Y',
+    )
+    fig.update_yaxes(showgrid=False)
+    fig.update_layout(
+        title={
+            'text': 'Fully Vaccinated People in {}'.format(country) if country else COUNTRY_PLACEHOLDER,
+            'y': 1,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+        },
+        font_family='Calibri',
+        title_font_size=21,
+        margin={
+            'r': 100,
+            't': 50,
+            'l': 100,
+            'b': 50,
+        },
+    )
+    return fig
+
+
+# CHOROPLETH MAP
+
+def build_choropleth_figure(df_choropleth, geojson=None, color='people_fully_vaccinated', range_color=(0, 9000000),
+                            color_title='Fully Vaccinated Numbers'):
+    # geojson is the URL of the shapes built by geometry.py, keyed by ISO code; without it the map uses
+    # Plotly's built-in world geometry. color names the column to colour by, for the derived metrics.
+    import plotly_express as px
+
+    fig = px.choropleth(
+        df_choropleth,
+        locations='iso_code',
+        color=color,
+        hover_name='country',
+        scope='world',
+        color_continuous_scale='bluered',
+        range_color=list(range_color),
+        animation_frame='date',
+    )
+    fig.update_xaxes(
+        domain=[0, 0.5],
+        tickformat='%d %b %Y',
+    )
+    fig.update_layout(
+        title={
+            'text': 'Number of Fully Vaccinated People per Country',
+            'y': 1,
+            'x': 0.4,
+            'xanchor': 'center',
+            'yanchor': 'top',
+        },
+        font_family='Calibri',
+        title_font_size=21,
+        coloraxis_colorbar=dict(title=color_title),
+        margin={'r': 600, 't': 50, 'l': 100, 'b': 0},
+        height=700,
+        width=1800,
+        transition={'duration': 3000},
+    )
+    fig.layout.updatemenus[0].buttons[0].args[1]['frame']['duration'] = 1000
+    fig.update_geos(
+        projection_scale=1,
+        resolution=110,
+    )
+    if geojson is not None:
+        # Only the first trace holds the shapes. The frames leave them out, so a level swapped in
+        # on zoom stays in place while the animation plays.
+        fig.update_traces(geojson=geojson, featureidkey='properties.iso_code', locationmode='geojson-id')
+        fig.update_geos(fitbounds='locations', visible=False)
+    return fig
+
+
+def split_frames(figure_json):
+    # The figure's data is already the first animation frame, so the frames can be sent separately
+    # and added to the plot once it is on the page. Slider steps and the play button refer to frames
+    # by name, so they start working as soon as the frames arrive.
+    initial = {key: value for key, value in figure_json.items() if key != 'frames'}
+    return initial, figure_json.get('frames', [])
@@ -0,0 +1,262 @@
+"""Build the map's country shapes, clipped to the configured regions, at several levels of detail.
+
+    python geometry.py ne_50m_admin_0_countries.geojson
+
+The source is any admin-0 GeoJSON (a path or URL), such as Natural Earth's. Only the countries of
+the configured regions are kept, keyed by the ISO codes the data uses, and parts of a country that lie
+outside the regions' bounds are dropped: French Guiana is part of France's shape in most world maps,
+which is why it used to be shaded as France. Each level is simplified with Douglas-Peucker and its
+coordinates rounded to a fixed number of decimals, and written to assets/geo/ with a manifest that the
+app reads at startup.
+"""
+import argparse
+import hashlib
+import json
+import os
+import urllib.request
+
+GEO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'geo')
+MANIFEST = 'manifest.json'
+
+# Name, simplification tolerance and coordinate decimals (both in degrees), and the largest map zoom
+# (geo.projection.scale) the level is used for; the last level covers every zoom beyond
+LEVELS = [
+    ('low', 0.2, 1, 2),
+    ('medium', 0.05, 2, 6),
+    ('high', 0.01, 3, None),
+]
+
+# lon_min, lat_min, lon_max, lat_max around Europe and Africa, including the Azores and Svalbard
+DEFAULT_BOUNDS = (-35, -50, 75, 85)
+
+# Properties that may hold a feature's ISO 3166-1 alpha-3 code. Natural Earth writes -99 into ISO_A3
+# for France and Norway, so its ADM0_A3 is tried as well.
+ISO_PROPERTIES = ['iso_code', 'ISO_A3_EH', 'ISO_A3', 'ADM0_A3', 'iso_a3', 'adm0_a3']
+
+
+# BUILD
+
+# numpy is imported by the functions that need it, as the app only reads the built levels
+
+def load_features(source):
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source) as response:
+            collection = json.loads(response.read())
+    else:
+        with open(source) as fh:
+            collection = json.load(fh)
+    return collection['features']
+
+
+def feature_iso(feature):
+    properties = feature.get('properties') or {}
+    for name in ISO_PROPERTIES:
+        value = properties.get(name)
+        if value and value != '-99':
+            return value
+    return None
+
+
+def polygons(geometry):
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def within(ring, bounds):
+    # A polygon is kept when the centre of its outer ring's bounding box is inside the bounds
+    import numpy as np
+
+    lon_min, lat_min, lon_max, lat_max = bounds
+    points = np.asarray(ring, dtype='float64')
+    lon, lat = (points.min(axis=0) + points.max(axis=0)) / 2
+    return lon_min <= lon <= lon_max and lat_min <= lat <= lat_max
+
+
+def simplify_ring(points, tolerance):
+    # Douglas-Peucker, iterative so that long coastlines do not hit the recursion limit
+    import numpy as np
+
+    if len(points) <= 4:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        inner = points[start + 1:end]
+        direction = b - a
+        norm = np.hypot(*direction)
+        if norm == 0:
+            # A closed ring's ends coincide, so measure from the point itself
+            distance = np.hypot(*(inner - a).T)
+        else:
+            distance = np.abs(direction[0] * (inner[:, 1] - a[1]) - direction[1] * (inner[:, 0] - a[0])) / norm
+        i = int(distance.argmax())
+        if distance[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.extend([(start, split), (split, end)])
+    return points[keep]
+
+
+def quantize_ring(points, decimals):
+    # Rounding shortens every coordinate in the JSON, and points that collapse onto the previous one
+    # are dropped. A ring needs four points (the first repeated last) to still enclose an area.
+    import numpy as np
+
+    points = np.round(points, decimals)
+    distinct = np.r_[True, np.any(points[1:] != points[:-1], axis=1)]
+    points = points[distinct]
+    if len(points) and np.any(points[0] != points[-1]):
+        points = np.vstack([points, points[:1]])
+    return points if len(points) >= 4 else None
+
+
+def shrink(polygon, tolerance, decimals):
+    import numpy as np
+
+    rings = []
+    for ring in polygon:
+        ring = quantize_ring(simplify_ring(np.asarray(ring, dtype='float64'), tolerance), decimals)
+        if ring is None:
+            if not rings:
+                # The outer ring collapsed, and with it the polygon
+                return None
+            continue
+        rings.append(ring.tolist())
+    return rings
+
+
+def build_level(shapes, tolerance, decimals):
+    features = []
+    vertices = 0
+    for iso_code, parts in shapes.items():
+        shrunk = [rings for rings in (shrink(polygon, tolerance, decimals) for polygon in parts) if rings]
+        if not shrunk:
+            # Small islands would vanish altogether, so keep the largest part at the source detail
+            largest = max(parts, key=lambda polygon: len(polygon[0]))
+            shrunk = [shrink(largest, 0, 6) or largest]
+        vertices += sum(len(ring) for rings in shrunk for ring in rings)
+        features.append({
+            'type': 'Feature',
+            'id': iso_code,
+            'properties': {'iso_code': iso_code},
+            'geometry': {'type': 'MultiPolygon', 'coordinates': shrunk},
+        })
+    return {'type': 'FeatureCollection', 'features': features}, vertices
+
+
+def region_iso_codes(config):
+    # The configured regions list country names, the data pairs them with ISO codes
+    import data_source
+
+    frame = data_source.load_snapshot().frame
+    pairs = frame.loc[frame['country'].isin(config.countries), ['country', 'iso_code']].dropna()
+    return set(pairs['iso_code'].astype(str))
+
+
+def build(source, out_dir=GEO_DIR, bounds=DEFAULT_BOUNDS, iso_codes=None):
+    from dashboard_config import load_config
+
+    iso_codes = region_iso_codes(load_config()) if iso_codes is None else set(iso_codes)
+    shapes = {}
+    for feature in load_features(source):
+        iso_code = feature_iso(feature)
+        if iso_code not in iso_codes:
+            continue
+        parts = [polygon for polygon in polygons(feature.get('geometry')) if polygon and within(polygon[0], bounds)]
+        if parts:
+            shapes.setdefault(iso_code, []).extend(parts)
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {'levels': []}
+    for name, tolerance, decimals, max_scale in LEVELS:
+        collection, vertices = build_level(shapes, tolerance, decimals)
+        body = json.dumps(collection, separators=(',', ':')).encode()
+        filename = 'regions-{}.json'.format(name)
+        with open(os.path.join(out_dir, filename), 'wb') as fh:
+            fh.write(body)
+        manifest['levels'].append({
+            'name': name,
+            'file': filename,
+            'hash': hashlib.sha256(body).hexdigest()[:16],
+            'max_scale': max_scale,
+            'vertices': vertices,
+            'bytes': len(body),
+        })
+    missing = sorted(iso_codes - set(shapes))
+    manifest['missing'] = missing
+    with open(os.path.join(out_dir, MANIFEST), 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+
+# SERVE
+
+class GeometryAssets:
+    """The built levels, read once and compressed for serving under content-hashed URLs."""
+
+    def __init__(self, levels, payloads):
+        self.levels = levels
+        self.payloads = payloads
+
+    @classmethod
+    def load(cls, directory=GEO_DIR):
+        # None until geometry.py has been run
+        try:
+            with open(os.path.join(directory, MANIFEST)) as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        from http_cache import CompressedPayload
+
+        levels, payloads = [], {}
+        for level in manifest['levels']:
+            with open(os.path.join(directory, level['file']), 'rb') as fh:
+                payloads[level['name']] = CompressedPayload(fh.read())
+            levels.append(dict(level, url='/_cetm25/geo/{}-{}.json'.format(level['name'], level['hash'])))
+        return cls(levels, payloads)
+
+    def payload(self, name, content_hash):
+        for level in self.levels:
+            if level['name'] == name and level['hash'] == content_hash:
+                return self.payloads[name]
+        return None
+
+    @property
+    def initial_url(self):
+        # The least detailed level, for the map's default zoom
+        return self.levels[0]['url']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='admin-0 countries GeoJSON, a path or URL')
+    parser.add_argument('--out-dir', default=GEO_DIR)
+    parser.add_argument(
+        '--bounds',
+        type=float,
+        nargs=4,
+        default=DEFAULT_BOUNDS,
+        metavar=('LON_MIN', 'LAT_MIN', 'LON_MAX', 'LAT_MAX'),
+        help='parts of countries outside these bounds are dropped',
+    )
+    args = parser.parse_args()
+
+    manifest = build(args.source, args.out_dir, tuple(args.bounds))
+    for level in manifest['levels']:
+        print('{name}: {vertices} vertices, {bytes} bytes'.format(**level))
+    if manifest['missing']:
+        print('No shape for: {}'.format(', '.join(manifest['missing'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import functools
+import gzip
+import hashlib
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# One year, for URLs that change whenever their content does
+IMMUTABLE_MAX_AGE = 31536000
+
+
+class CompressedPayload:
+    """A response body compressed once up front, served with a strong ETag.
+
+    gzip is always available; brotli is used as well when the optional `brotli` package is installed.
+    """
+
+    def __init__(self, body, mimetype='application/json'):
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {
+            'identity': body,
+            'gzip': gzip.compress(body, compresslevel=6),
+        }
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body)
+
+    def encoding_for(self, request):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and request.accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+    def response(self, request=None, max_age=0, immutable=False):
+        request = request or flask.request
+        if self.etag in request.if_none_match:
+            response = flask.Response(status=304)
+        else:
+            encoding = self.encoding_for(request)
+            response = flask.Response(self.variants[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'public, max-age={}{}'.format(max_age, ', immutable' if immutable else '')
+        return response
+
+
+def cache_view(server, endpoint, key, cache):
+    """Serve a GET view from compressed copies of its response, one per value of `key()`.
+
+    The view runs once per key, and repeat visitors revalidate with If-None-Match and get a 304.
+    When key() returns None the view is called as usual.
+    """
+    view = server.view_functions[endpoint]
+
+    def build(args, kwargs):
+        response = view(*args, **kwargs)
+        return CompressedPayload(response.get_data(), mimetype=response.mimetype)
+
+    @functools.wraps(view)
+    def cached_view(*args, **kwargs):
+        value = key()
+        if value is None:
+            return view(*args, **kwargs)
+        return cache.get_or_build(value, lambda: build(args, kwargs)).response()
+
+    server.view_functions[endpoint] = cached_view
+
+
+def compress_responses(server, path, min_bytes, cache):
+    """Compress responses to `path` that are at least `min_bytes` long.
+
+    Compressed bodies are kept in `cache` by the hash of the body, so a response that is sent again,
+    e.g. a cached callback result, is not compressed again and can use brotli.
+    """
+    @server.after_request
+    def compress_response(response):
+        request = flask.request
+        if (request.path != path or response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+        body = response.get_data()
+        if len(body) < min_bytes:
+            return response
+        payload = cache.get_or_build(
+            hashlib.sha256(body).digest(),
+            lambda: CompressedPayload(body, mimetype=response.mimetype),
+        )
+        encoding = payload.encoding_for(request)
+        if encoding != 'identity':
+            response.set_data(payload.variants[encoding])
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    return compress_response
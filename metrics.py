@@ -0,0 +1,219 @@
+import contextlib
+import cProfile
+import hashlib
+import os
+import random
+import threading
+import time
+
+import flask
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+BYTES_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+
+# Beyond this many distinct input buckets per callback, further ones are reported as 'other'
+MAX_INPUT_BUCKETS = 32
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Counters and histograms in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=(), buckets=SECONDS_BUCKETS):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def add_collector(self, collect):
+        # collect() returns (name, labels, value) samples that are read at scrape time
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append('# HELP {} {}'.format(name, self._help[name]))
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append('{}{} {}'.format(name, _labels(labels), _number(value)))
+
+        for (name, labels), counts, total, count, buckets in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ['+Inf'], counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (('le', _number(bound)),)
+                lines.append('{}_bucket{} {}'.format(name, _labels(bucket_labels), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _labels(labels), _number(total)))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), count))
+
+        for collect in self._collectors:
+            for name, labels, value in collect():
+                header(name, 'gauge')
+                lines.append('{}{} {}'.format(name, _labels(labels), _number(value)))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    ) + '}'
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+REGISTRY.describe('cetm25_callback_seconds', 'Server-side duration of Dash callback requests')
+REGISTRY.describe('cetm25_callback_response_bytes', 'Size of Dash callback responses')
+REGISTRY.describe('cetm25_callback_errors_total', 'Dash callback requests that did not return 200 or 204')
+REGISTRY.describe('cetm25_stage_seconds', 'Duration of data loading and pipeline stages')
+REGISTRY.describe('cetm25_cache_hits', 'Cache hits since the process started')
+REGISTRY.describe('cetm25_cache_misses', 'Cache misses since the process started')
+
+
+@contextlib.contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe('cetm25_stage_seconds', time.perf_counter() - start, labels=(('stage', name),))
+
+
+def watch_cache(name, cache):
+    REGISTRY.add_collector(lambda: [
+        ('cetm25_cache_hits', (('cache', name),), cache.hits),
+        ('cetm25_cache_misses', (('cache', name),), cache.misses),
+    ])
+
+
+# CALLBACK INSTRUMENTATION
+
+_input_buckets = {}
+_input_buckets_lock = threading.Lock()
+
+
+def bucket_inputs(callback_id, inputs):
+    # Short values are kept as they are, long ones (e.g. the annotation texts) are hashed, and the
+    # number of distinct buckets per callback is capped so label cardinality stays bounded
+    parts = []
+    for item in inputs:
+        value = item.get('value') if isinstance(item, dict) else None
+        text = str(value)
+        if len(text) > 32:
+            text = 'h:' + hashlib.sha1(text.encode()).hexdigest()[:8]
+        parts.append(text)
+    bucket = '|'.join(parts)
+    with _input_buckets_lock:
+        seen = _input_buckets.setdefault(callback_id, set())
+        if bucket not in seen:
+            if len(seen) >= MAX_INPUT_BUCKETS:
+                return 'other'
+            seen.add(bucket)
+    return bucket
+
+
+def install(server, path='/metrics'):
+    """Time every _dash-update-component request and serve the registry on `path`.
+
+    Setting CETM25_PROFILE_RATE to a fraction between 0 and 1 also runs that share of callback
+    requests under cProfile, writing one .prof file per sampled request to CETM25_PROFILE_DIR.
+    """
+    profile_rate = float(os.environ.get('CETM25_PROFILE_RATE', '0'))
+    profile_dir = os.environ.get('CETM25_PROFILE_DIR', 'profiles')
+
+    @server.before_request
+    def start_callback_timer():
+        if not flask.request.path.endswith('/_dash-update-component'):
+            return
+        flask.g.cetm25_start = time.perf_counter()
+        if profile_rate > 0 and random.random() < profile_rate:
+            flask.g.cetm25_profiler = cProfile.Profile()
+            flask.g.cetm25_profiler.enable()
+
+    @server.after_request
+    def record_callback(response):
+        start = flask.g.pop('cetm25_start', None)
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+        body = flask.request.get_json(silent=True) or {}
+        callback_id = body.get('output', 'unknown')
+
+        profiler = flask.g.pop('cetm25_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            name = '{}-{}-{}.prof'.format(
+                hashlib.sha1(callback_id.encode()).hexdigest()[:8], os.getpid(), time.time_ns(),
+            )
+            profiler.dump_stats(os.path.join(profile_dir, name))
+
+        labels = (
+            ('callback', callback_id),
+            ('inputs', bucket_inputs(callback_id, body.get('inputs', []))),
+        )
+        REGISTRY.observe('cetm25_callback_seconds', duration, labels=labels)
+        size = response.calculate_content_length()
+        if size is not None:
+            REGISTRY.observe('cetm25_callback_response_bytes', size, labels=labels[:1], buckets=BYTES_BUCKETS)
+        if response.status_code not in (200, 204):
+            REGISTRY.inc('cetm25_callback_errors_total', labels=labels[:1] + (('status', response.status_code),))
+        return response
+
+    @server.route(path)
+    def serve_metrics():
+        return flask.Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
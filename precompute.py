@@ -0,0 +1,61 @@
+"""Build figure variants in a process pool, so that startup scales with cores.
+
+Each task is a builder from figures.py and its arguments. The workers return Plotly's serialized
+JSON, which is decoded once here into the plain JSON the figure cache and the layout use.
+"""
+import concurrent.futures
+import json
+import multiprocessing
+import os
+
+import figures
+
+BUILDERS = {
+    'line_graph': figures.build_line_figure,
+    'map': figures.build_choropleth_figure,
+}
+
+
+def figure_tasks(dataset, include_map=True, map_geojson=None):
+    # Keyed like the figure cache: one line graph per dropdown value, and the map
+    config = dataset.config
+    tasks = {
+        ('line_graph', option['value']): (
+            'line_graph',
+            (dataset.df_total_vacs,),
+            {'range_x': [config.dates[0], option['value']], 'colors': config.region_colors},
+        )
+        for option in config.range_options
+    }
+    if include_map:
+        tasks[('map',)] = ('map', (dataset.df_choropleth,), {'geojson': map_geojson})
+    return tasks
+
+
+def build(task):
+    kind, args, kwargs = task
+    return BUILDERS[kind](*args, **kwargs).to_json()
+
+
+def default_workers():
+    return int(os.environ.get('CETM25_FIGURE_WORKERS', os.cpu_count() or 1))
+
+
+def fork_context():
+    # Spawned workers would re-import the app module, which loads the data and starts a pool of its own,
+    # so without fork the figures are built in this process
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork')
+
+
+def precompute(tasks, workers=None):
+    workers = default_workers() if workers is None else workers
+    workers = min(workers, len(tasks))
+    context = fork_context()
+    if workers <= 1 or context is None:
+        results = [build(task) for task in tasks.values()]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(build, tasks.values()))
+    return {key: json.loads(result) for key, result in zip(tasks, results)}
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class RangeQueries:
+    """Totals, deltas and averages of each region's series over any date range, in O(1).
+
+    `totals` is a ContinentAggregates, over the grid dates or over every day. Its cumulative sums
+    along the dates are computed once, so the average over a range is one subtraction however long
+    the range is.
+    """
+
+    def __init__(self, totals):
+        self.regions = list(totals.continents)
+        self.dates = np.asarray(totals.dates, dtype='datetime64[D]')
+        self.values = totals.totals
+        self.prefix = np.zeros((len(self.regions), len(self.dates) + 1))
+        np.cumsum(self.values, axis=1, out=self.prefix[:, 1:])
+        self.prefix.setflags(write=False)
+        self._region_index = {region: i for i, region in enumerate(self.regions)}
+        # Consecutive days are found by arithmetic, other grids by bisection
+        self._daily = len(self.dates) > 1 and bool(np.all(np.diff(self.dates) == np.timedelta64(1, 'D')))
+
+    def _position(self, date, side):
+        # Index of the first date on or after `date` (side='left'), or of the last one on or before it
+        date = np.datetime64(str(date)[:10], 'D')
+        if self._daily:
+            return int((date - self.dates[0]) / np.timedelta64(1, 'D'))
+        index = int(np.searchsorted(self.dates, date, side=side))
+        return index if side == 'left' else index - 1
+
+    def query(self, region, start=None, end=None):
+        if region not in self._region_index:
+            raise ValueError('Unknown region {!r}'.format(region))
+        if not len(self.dates):
+            raise ValueError('No data')
+        i = self._region_index[region]
+        lo = 0 if start is None else max(self._position(start, 'left'), 0)
+        hi = len(self.dates) - 1 if end is None else min(self._position(end, 'right'), len(self.dates) - 1)
+        if lo > hi:
+            raise ValueError('No data between {} and {}'.format(start, end))
+        points = hi - lo + 1
+        return {
+            'region': region,
+            'start': str(self.dates[lo]),
+            'end': str(self.dates[hi]),
+            'points': points,
+            'start_value': float(self.values[i, lo]),
+            'end_value': float(self.values[i, hi]),
+            'delta': float(self.values[i, hi] - self.values[i, lo]),
+            'average': float((self.prefix[i, hi + 1] - self.prefix[i, lo]) / points),
+        }
@@ -0,0 +1,129 @@
+import collections
+
+import numpy as np
+
+# Incremental appends add a block each; past this many the blocks are merged into one
+MAX_BLOCKS = 8
+
+# countries[i]'s readings are dates[offsets[i]:offsets[i + 1]] and values[offsets[i]:offsets[i + 1]]
+Block = collections.namedtuple('Block', ['countries', 'iso_codes', 'offsets', 'dates', 'values'])
+
+
+class CountrySeries:
+    """Every country's daily series, stored as contiguous arrays sorted by country and date.
+
+    The arrays come in blocks: the one built from the full frame, and one per incremental append
+    holding only the new days, so an append never re-sorts the history. Every block's dates come after
+    the previous block's, and a lookup is a dict hit and one slice per block instead of a boolean mask
+    over the whole frame.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = list(blocks)
+        for block in self.blocks:
+            for array in (block.offsets, block.dates, block.values):
+                array.setflags(write=False)
+        iso_codes = {}
+        for block in self.blocks:
+            iso_codes.update(zip(block.countries, block.iso_codes))
+        self.countries = sorted(iso_codes)
+        self.iso_codes = [iso_codes[country] for country in self.countries]
+        self._country_index = {country: i for i, country in enumerate(self.countries)}
+        self._iso_index = {iso_code: i for i, iso_code in enumerate(self.iso_codes)}
+        self._block_index = [
+            {country: i for i, country in enumerate(block.countries)}
+            for block in self.blocks
+        ]
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls([block_from_frame(df)])
+
+    def extend(self, block):
+        """A new index with `block` (see block_from_frame), dated after the readings already indexed."""
+        blocks = self.blocks + [block]
+        if len(blocks) > MAX_BLOCKS:
+            blocks = [merge_blocks(blocks)]
+        return CountrySeries(blocks)
+
+    def daily_matrix(self):
+        # Country x day matrix over every day from the first reading to the last, with each country's
+        # last reading carried forward over the days it did not report
+        dates = [block.dates for block in self.blocks if len(block.dates)]
+        if not dates:
+            return np.array([], dtype='datetime64[D]'), np.empty((len(self.countries), 0))
+        first = min(block_dates.min() for block_dates in dates)
+        days = np.arange(first, max(block_dates.max() for block_dates in dates) + np.timedelta64(1, 'D'))
+        matrix = np.full((len(self.countries), len(days)), np.nan)
+        for block in self.blocks:
+            scatter(matrix, block, self._country_index, first)
+        return days, fill_days(matrix)
+
+    def country_for_iso(self, iso_code):
+        i = self._iso_index.get(iso_code)
+        return None if i is None else self.countries[i]
+
+    def series(self, country):
+        # Read-only views into the arrays when one block holds the country, or None if none does
+        if country not in self._country_index:
+            return None
+        parts = []
+        for block, index in zip(self.blocks, self._block_index):
+            i = index.get(country)
+            if i is not None:
+                start, stop = block.offsets[i], block.offsets[i + 1]
+                parts.append((block.dates[start:stop], block.values[start:stop]))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate([dates for dates, _ in parts]), np.concatenate([values for _, values in parts])
+
+
+def block_from_frame(df):
+    # df is cleaned and forward-filled per country; only this frame is sorted
+    frame = df.loc[df['country'].notna()].sort_values(['country', 'date'], kind='mergesort')
+    names = frame['country'].astype(str).to_numpy()
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]]) if len(names) else np.array([], dtype='int64')
+    return Block(
+        countries=list(names[starts]),
+        iso_codes=list(frame['iso_code'].astype(str).to_numpy()[starts]),
+        offsets=np.append(starts, len(names)).astype('int64'),
+        dates=frame['date'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]'),
+        values=frame['people_fully_vaccinated'].to_numpy(dtype='float64', na_value=np.nan),
+    )
+
+
+def merge_blocks(blocks):
+    # Blocks are in date order, so each country's readings are its slices of every block in turn.
+    # They are copied into place by offset, without sorting.
+    countries = sorted({country for block in blocks for country in block.countries})
+    index = {country: i for i, country in enumerate(countries)}
+    iso_codes = {}
+    counts = np.zeros((len(blocks), len(countries)), dtype='int64')
+    for b, block in enumerate(blocks):
+        iso_codes.update(zip(block.countries, block.iso_codes))
+        counts[b, [index[country] for country in block.countries]] = np.diff(block.offsets)
+    offsets = np.r_[0, np.cumsum(counts.sum(axis=0))]
+    # Where each block's slice of a country starts in the merged arrays
+    starts = offsets[:-1] + np.r_[np.zeros((1, len(countries)), dtype='int64'), np.cumsum(counts, axis=0)[:-1]]
+    dates = np.empty(offsets[-1], dtype='datetime64[D]')
+    values = np.empty(offsets[-1], dtype='float64')
+    for b, block in enumerate(blocks):
+        rows = [index[country] for country in block.countries]
+        sizes = np.diff(block.offsets)
+        destination = np.repeat(starts[b, rows] - block.offsets[:-1], sizes) + np.arange(block.offsets[-1])
+        dates[destination] = block.dates
+        values[destination] = block.values
+    return Block(countries, [iso_codes[country] for country in countries], offsets, dates, values)
+
+
+def scatter(matrix, block, country_index, first):
+    # Write a block's readings into a country x day matrix whose first column is the day `first`
+    rows = np.repeat([country_index[country] for country in block.countries], np.diff(block.offsets))
+    matrix[rows.astype('int64'), (block.dates - first).astype('int64')] = block.values
+
+
+def fill_days(matrix):
+    # Carry each row's last reading forward over the days without one
+    filled = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[1]))
+    np.maximum.accumulate(filled, axis=1, out=filled)
+    return matrix[np.arange(matrix.shape[0])[:, None], filled]
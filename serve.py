@@ -0,0 +1,132 @@
+"""Production server for the dashboard.
+
+The data is loaded and cleaned once in the gunicorn master process (preload), and the workers are
+forked from it, so they share those pages copy-on-write instead of each running the pipeline:
+
+    python serve.py --workers 4 --threads 4 --bind 0.0.0.0:8050
+
+With CETM25_WARMUP=background the master only imports the app, and each worker loads the data and
+builds the figures in a background thread after it is forked, answering /healthz and /ready (with
+progress) in the meantime. The workers then hold their own copies of the data.
+
+Send SIGHUP to the master for a graceful reload: new workers are forked and the old ones finish
+their in-flight requests first. Data refreshes themselves are handled inside each worker by the
+background refresher (CETM25_REFRESH_INTERVAL).
+
+With --shared-memory, a separate publisher process loads the data and publishes the pivot and the
+region totals to shared memory (see shared_dataset.py), republishing every --publish-interval
+seconds when the data changes. Every worker attaches to the same segment instead of holding its own
+copy, and switches to a new one when its version changes.
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+
+def post_fork(server, worker):
+    # With CETM25_WARMUP=background the data is loaded in each worker after the fork, so that workers
+    # answer /healthz and /ready while they warm up
+    from CETM25_visualisation_app import start_warmup
+    start_warmup()
+
+
+def when_ready(server):
+    # Objects created while preloading are never freed, so moving them out of the garbage collector's
+    # generations stops collections in the workers from touching, and so copying, their pages
+    gc.collect()
+    gc.freeze()
+
+
+if BaseApplication is not None:
+    class DashboardApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from CETM25_visualisation_app import server
+            return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the dashboard with preloaded, forked workers.')
+    parser.add_argument('--bind', default=os.environ.get('CETM25_BIND', '0.0.0.0:8050'))
+    parser.add_argument(
+        '--workers', type=int, default=int(os.environ.get('CETM25_WORKERS', multiprocessing.cpu_count())),
+    )
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('CETM25_THREADS', '4')))
+    parser.add_argument('--timeout', type=int, default=60)
+    parser.add_argument('--graceful-timeout', type=int, default=30)
+    parser.add_argument(
+        '--max-requests', type=int, default=0,
+        help='restart a worker after this many requests, 0 to never restart',
+    )
+    parser.add_argument('--shared-memory', action='store_true', help='share the dataset through shared memory')
+    parser.add_argument(
+        '--publish-interval', type=float, default=0,
+        help='with --shared-memory, seconds between data refreshes, 0 to publish once',
+    )
+    return parser.parse_args(argv)
+
+
+def start_publisher(interval):
+    import shared_dataset
+
+    ready = multiprocessing.Event()
+    publisher = multiprocessing.Process(
+        target=shared_dataset.publish_loop,
+        args=(shared_dataset.load_dataset, interval, ready),
+        name='cetm25-publisher',
+        daemon=True,
+    )
+    publisher.start()
+    while not ready.wait(1):
+        if not publisher.is_alive():
+            raise SystemExit('The shared dataset publisher exited before publishing')
+    return publisher
+
+
+def main(argv=None):
+    if BaseApplication is None:
+        raise SystemExit('serve.py needs gunicorn: pip install gunicorn')
+    args = parse_args(argv)
+
+    publisher = None
+    if args.shared_memory:
+        os.environ['CETM25_SHARED_MEMORY'] = '1'
+        publisher = start_publisher(args.publish_interval)
+
+    application = DashboardApplication({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+    })
+    try:
+        application.run()
+    finally:
+        if publisher is not None:
+            import shared_dataset
+            publisher.terminate()
+            shared_dataset.unlink_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""Publish the cleaned pivot and the region totals as a read-only shared-memory segment.
+
+One publisher process builds the dataset and writes it to a new segment per data version. A small
+control segment holds the name of the current one and a version counter, which worker processes
+poll; they attach to the new segment zero-copy when the counter changes. Pages that are still
+attached to an older segment stay valid after the publisher unlinks it.
+"""
+import argparse
+import json
+import logging
+import os
+import struct
+import time
+from multiprocessing import (
+    resource_tracker,
+    shared_memory,
+)
+
+import numpy as np
+import pandas as pd
+
+from aggregates import ContinentAggregates
+
+logger = logging.getLogger(__name__)
+
+CONTROL_NAME = 'cetm25-current'
+# Version counter (int64) followed by the current segment's name
+CONTROL_FORMAT = 'q120s'
+CONTROL_SIZE = struct.calcsize(CONTROL_FORMAT)
+
+ALIGNMENT = 64
+
+# A read that races the publisher is retried this many times, CONTROL_RETRY_DELAY seconds apart
+CONTROL_RETRIES = 100
+CONTROL_RETRY_DELAY = 0.001
+
+
+class SharedDataset:
+    """Read-only views of one published segment.
+
+    Provides what DashboardState needs from a Dataset: version, config, totals, df_total_vacs and
+    df_choropleth, with the numeric arrays living in shared memory.
+    """
+
+    def __init__(self, shm, config, counter):
+        self._shm = shm
+        self.config = config
+        self.counter = counter
+
+        (meta_size,) = struct.unpack_from('q', shm.buf, 0)
+        meta = json.loads(bytes(shm.buf[8:8 + meta_size]))
+        self.version = meta['version']
+        self.dates = meta['dates']
+        self.countries = meta['countries']
+        self.iso_codes = meta['iso_codes']
+        self.regions = meta['regions']
+        arrays = {}
+        for name, (offset, shape) in meta['arrays'].items():
+            array = np.ndarray(shape, dtype='float64', buffer=shm.buf, offset=offset)
+            array.setflags(write=False)
+            arrays[name] = array
+        self.pivot = arrays['pivot']
+        self.totals = ContinentAggregates(self.regions, self.dates, arrays['totals'])
+        self.df_total_vacs = self.totals.to_frame()
+        # Only the grid dates are published, so there is no daily series to drill down into
+        self.series = None
+        self.daily_totals = None
+        self.cube = None
+
+    @property
+    def df_choropleth(self):
+        # Long format of the pivot for the map's countries, only built when a state is built from it
+        keep = np.isin(self.countries, self.config.countries)
+        labels = pd.to_datetime(pd.Series(self.dates)).dt.strftime('%d %b %Y').tolist()
+        return pd.DataFrame({
+            'country': np.repeat(np.array(self.countries)[keep], len(self.dates)),
+            'iso_code': np.repeat(np.array(self.iso_codes)[keep], len(self.dates)),
+            'date': np.tile(labels, int(keep.sum())),
+            'people_fully_vaccinated': self.pivot[keep].ravel(),
+        })
+
+
+def publish(dataset, previous_name=None):
+    """Write the dataset to a new segment and point the control segment at it.
+
+    Returns the new segment's name; the one named `previous_name` is unlinked afterwards.
+    """
+    df_pivot = dataset.df_pivot
+    dates = list(dataset.config.dates)
+    arrays = {
+        'pivot': df_pivot[dates].to_numpy(dtype='float64', na_value=np.nan),
+        'totals': np.ascontiguousarray(dataset.totals.totals),
+    }
+    meta = {
+        'version': dataset.version,
+        'dates': dates,
+        'countries': df_pivot['country'].astype(str).tolist(),
+        'iso_codes': df_pivot['iso_code'].astype(str).tolist(),
+        'regions': dataset.totals.continents,
+        'arrays': {},
+    }
+
+    # Arrays go after the metadata, so their offsets are computed with room for it
+    header_size = 8 + len(json.dumps(meta)) + 64 * len(arrays) + 256
+    offset = _align(header_size)
+    for name, array in arrays.items():
+        meta['arrays'][name] = [offset, list(array.shape)]
+        offset = _align(offset + array.nbytes)
+    meta_bytes = json.dumps(meta).encode()
+    assert 8 + len(meta_bytes) <= header_size
+
+    counter = read_control()[0] + 1
+    name = 'cetm25-{}-{}'.format(os.getpid(), counter)
+    shm = _create(name, offset)
+    struct.pack_into('q', shm.buf, 0, len(meta_bytes))
+    shm.buf[8:8 + len(meta_bytes)] = meta_bytes
+    for name_, array in arrays.items():
+        start, shape = meta['arrays'][name_]
+        np.ndarray(shape, dtype='float64', buffer=shm.buf, offset=start)[...] = array
+    shm.close()
+
+    _write_control(counter, name)
+    if previous_name is not None:
+        _unlink(previous_name)
+    return name
+
+
+def attach(config, known_counter=None):
+    """Attach to the current segment, or return None if it is the one `known_counter` refers to."""
+    counter, name = read_control()
+    if not name or counter == known_counter:
+        return None
+    shm = shared_memory.SharedMemory(name=name)
+    # Attaching registers the segment with this process' resource tracker, which would unlink it
+    # when the worker exits; only the publisher owns it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return SharedDataset(shm, config, counter)
+
+
+def read_control():
+    try:
+        control = shared_memory.SharedMemory(name=CONTROL_NAME)
+    except FileNotFoundError:
+        return 0, ''
+    try:
+        resource_tracker.unregister(control._name, 'shared_memory')
+        # The counter is -1 while the publisher rewrites the name, and a read that overlaps a write
+        # sees two different counters, so either way it is retried
+        for _ in range(CONTROL_RETRIES):
+            counter, name = struct.unpack_from(CONTROL_FORMAT, control.buf, 0)
+            if counter != -1 and struct.unpack_from('q', control.buf, 0)[0] == counter:
+                return counter, name.rstrip(b'\0').decode()
+            time.sleep(CONTROL_RETRY_DELAY)
+        raise RuntimeError('No consistent read of {} after {} attempts'.format(CONTROL_NAME, CONTROL_RETRIES))
+    finally:
+        control.close()
+
+
+def _write_control(counter, name):
+    try:
+        control = _create(CONTROL_NAME, CONTROL_SIZE)
+    except FileExistsError:
+        control = shared_memory.SharedMemory(name=CONTROL_NAME)
+        resource_tracker.unregister(control._name, 'shared_memory')
+    struct.pack_into('q', control.buf, 0, -1)
+    struct.pack_into('120s', control.buf, 8, name.encode())
+    struct.pack_into('q', control.buf, 0, counter)
+    control.close()
+
+
+def _create(name, size):
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    # Segments outlive the process that created them, until unlink_all() or the next publish
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _unlink(name):
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    # unlink() also unregisters the segment from the resource tracker
+    shm.unlink()
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def unlink_all():
+    counter, name = read_control()
+    if name:
+        _unlink(name)
+    _unlink(CONTROL_NAME)
+
+
+def publish_loop(load_dataset, interval, ready=None):
+    """Publish the dataset returned by load_dataset(), then republish it every `interval` seconds
+    when its version changes. load_dataset(refresh=True, known_version=...) returns None when the source
+    is still at that version. `ready` is an optional Event set after the first publish.
+    """
+    dataset = load_dataset()
+    name = publish(dataset)
+    if ready is not None:
+        ready.set()
+    while interval > 0:
+        time.sleep(interval)
+        try:
+            fresh = load_dataset(refresh=True, known_version=dataset.version)
+        except Exception:
+            logger.exception('Shared dataset refresh failed')
+            continue
+        if fresh is not None:
+            dataset = fresh
+            name = publish(dataset, previous_name=name)
+            logger.info('Published data version %s as %s', dataset.version, name)
+
+
+def load_dataset(refresh=None, known_version=None):
+    import data_source
+    from dashboard_config import load_config
+    from dataset import build_dataset
+    snapshot = data_source.load_snapshot(refresh=refresh)
+    if snapshot.version == known_version:
+        return None
+    return build_dataset(snapshot, load_config())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish the dashboard dataset to shared memory.')
+    parser.add_argument('--interval', type=float, default=0, help='seconds between refreshes, 0 publishes once')
+    parser.add_argument('--unlink', action='store_true', help='remove the published segments and exit')
+    args = parser.parse_args()
+    if args.unlink:
+        unlink_all()
+        return
+    logging.basicConfig(level=logging.INFO)
+    publish_loop(load_dataset, args.interval)
+
+
+if __name__ == '__main__':
+    main()
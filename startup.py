@@ -0,0 +1,65 @@
+"""Startup work that can run in the background while the server already answers health checks."""
+import contextlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Runs `target(warmup)` once, recording the stages it goes through for the readiness endpoint.
+
+    run() does the work in the calling thread and raises on failure; start() does it in a background
+    thread and records the failure instead.
+    """
+
+    def __init__(self, stages, target):
+        self.stages = list(stages)
+        self.target = target
+        self.stage = None
+        self.completed = []
+        self.error = None
+        self.ready = threading.Event()
+        self._started_at = None
+        self._thread = None
+
+    @contextlib.contextmanager
+    def step(self, name):
+        self.stage = name
+        start = time.monotonic()
+        yield
+        self.completed.append({'stage': name, 'seconds': round(time.monotonic() - start, 3)})
+
+    def run(self):
+        self._started_at = time.monotonic()
+        self.target(self)
+        self.stage = None
+        self.ready.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run_logged, name='cetm25-warmup', daemon=True)
+        self._thread.start()
+
+    def _run_logged(self):
+        try:
+            self.run()
+        except Exception as error:
+            logger.exception('Startup failed')
+            self.error = '{}: {}'.format(type(error).__name__, error)
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def status(self):
+        return {
+            'ready': self.ready.is_set(),
+            'stage': self.stage,
+            'progress': round(len(self.completed) / len(self.stages), 3) if self.stages else 1.0,
+            'completed': list(self.completed),
+            'elapsed_s': round(time.monotonic() - self._started_at, 3) if self._started_at is not None else 0.0,
+            'error': self.error,
+        }
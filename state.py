@@ -0,0 +1,125 @@
+import json
+import logging
+import threading
+
+import figures
+from http_cache import CompressedPayload
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardState:
+    """One data version together with the figures prebuilt from it.
+
+    A state is never modified after it has been built. A refresh builds a new one and swaps it in,
+    so a callback that has already read the current state keeps using it until it finishes.
+    """
+
+    def __init__(self, dataset, lazy_map_frames, previous=None, map_figure=None, map_geojson=None):
+        self.dataset = dataset
+        self.config = dataset.config
+        self.version = dataset.version
+        self.lazy_map_frames = lazy_map_frames
+        self.map_geojson = map_geojson
+        # Range queries over the grid dates (the cards) and, when the daily series is kept, every day.
+        # range_query needs numpy, which the app only imports once the data is loaded.
+        from range_query import RangeQueries
+
+        self.queries = {'grid': RangeQueries(dataset.totals)}
+        if getattr(dataset, 'daily_totals', None) is not None:
+            self.queries['daily'] = RangeQueries(dataset.daily_totals)
+
+        if previous is not None and previous.version == self.version:
+            # The grid dates did not change, so neither did the map
+            self.map_figure = previous.map_figure
+            self.map_frames_payload = previous.map_frames_payload
+        else:
+            self.map_figure, self.map_frames_payload = self._build_map(map_figure)
+
+    def _build_map(self, figure_map=None):
+        # figure_map may already have been built, e.g. by precompute
+        if figure_map is None:
+            figure_map = figures.to_figure_json(
+                figures.build_choropleth_figure(self.dataset.df_choropleth, geojson=self.map_geojson)
+            )
+        # Only the first frame goes into the layout, the rest are fetched once the page has loaded
+        if not self.lazy_map_frames:
+            return figure_map, None
+        initial, frames = figures.split_frames(figure_map)
+        return initial, CompressedPayload(json.dumps(frames, separators=(',', ':')).encode())
+
+    @property
+    def map_frames_url(self):
+        # The URL changes with the data version, so the frames can be cached by the browser indefinitely
+        if not self.lazy_map_frames:
+            return None
+        return '/_cetm25/map-frames/{}.json'.format(self.version)
+
+    def build_line_figure(self, range_end):
+        return figures.to_figure_json(
+            figures.build_line_figure(
+                self.dataset.df_total_vacs,
+                range_x=[self.config.dates[0], range_end],
+                colors=self.config.region_colors,
+            )
+        )
+
+
+class StateHolder:
+    """Holds the current state; swapping is a single reference assignment."""
+
+    def __init__(self, state):
+        self.current = state
+        # Kept so that pages loaded just before a swap can still fetch their map frames
+        self.previous = None
+        self._listeners = []
+
+    def on_swap(self, listener):
+        self._listeners.append(listener)
+
+    def swap(self, state):
+        old = self.current
+        self.previous, self.current = old, state
+        for listener in self._listeners:
+            listener(old, state)
+
+    def find(self, version):
+        for state in (self.current, self.previous):
+            if state is not None and state.version == version:
+                return state
+        return None
+
+
+class Refresher(threading.Thread):
+    """Rebuilds the state in the background every `interval` seconds.
+
+    `rebuild` is given the current state and returns a new one, or None when nothing changed.
+    """
+
+    def __init__(self, holder, rebuild, interval):
+        super().__init__(name='cetm25-refresher', daemon=True)
+        self.holder = holder
+        self.rebuild = rebuild
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.refresh_once()
+
+    def refresh_once(self):
+        try:
+            state = self.rebuild(self.holder.current)
+        except Exception:
+            # Keep serving the current data, and try again on the next interval
+            logger.exception('Data refresh failed')
+            return False
+        if state is None:
+            return False
+        self.holder.swap(state)
+        logger.info('Swapped in data version %s', state.version)
+        return True
+
+    def stop(self):
+        self._stopped.set()
+
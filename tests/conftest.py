@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+# The dashboard's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COUNTRIES = [
+    ('France', 'FRA'),
+    ('Germany', 'DEU'),
+    ('Kenya', 'KEN'),
+    ('Nigeria', 'NGA'),
+    # In neither region
+    ('Japan', 'JPN'),
+]
+
+
+def vaccination_rows(seed=0):
+    """A small frame shaped like the source CSV: countries reporting on irregular days, with gaps."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2021-01-01', '2021-04-30').strftime('%Y-%m-%d')
+    parts = []
+    for country, iso_code in COUNTRIES:
+        reported = np.sort(rng.choice(len(days), size=70, replace=False))
+        values = np.cumsum(rng.integers(0, 5000, size=len(reported))).astype('float64')
+        values[rng.random(len(reported)) < 0.2] = np.nan
+        parts.append(pd.DataFrame({
+            'country': country,
+            'iso_code': iso_code,
+            'date': days[reported],
+            'people_fully_vaccinated': values,
+        }))
+    # The source is sorted by country and date
+    return pd.concat(parts, ignore_index=True)
+
+
+@pytest.fixture
+def vaccinations_csv(tmp_path):
+    path = tmp_path / 'vaccinations.csv'
+    vaccination_rows().to_csv(path, index=False)
+    return str(path)
@@ -0,0 +1,242 @@
+import fnmatch
+import os
+import socket
+import socketserver
+import threading
+
+import pytest
+
+import caching
+from caching import (
+    MISSING,
+    DiskCache,
+    RedisCache,
+    RespClient,
+    cached_callback,
+)
+
+
+# RESP STAND-IN
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of a Redis server for RedisCache: GET, SET with EX, SCAN with MATCH and COUNT, DEL.
+
+    Expiry is only recorded, not enforced. Setting `fail` makes every command answer with an error.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RespHandler)
+        self.data = {}
+        self.expiry = {}
+        self.commands = []
+        self.fail = False
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def reply(self, command):
+        name, args = command[0].decode().upper(), command[1:]
+        with self._lock:
+            self.commands.append(name)
+            if self.fail:
+                return b'-ERR stand-in failure\r\n'
+            if name == 'GET':
+                return bulk(self.data.get(args[0]))
+            if name == 'SET':
+                self.data[args[0]] = args[1]
+                self.expiry.pop(args[0], None)
+                if len(args) == 4 and args[2].upper() == b'EX':
+                    self.expiry[args[0]] = int(args[3])
+                return b'+OK\r\n'
+            if name == 'SCAN':
+                return self._scan(int(args[0]), dict(zip([arg.upper() for arg in args[1::2]], args[2::2])))
+            if name == 'DEL':
+                removed = [key for key in args if self.data.pop(key, None) is not None]
+                return b':%d\r\n' % len(removed)
+            return b'-ERR unknown command\r\n'
+
+    def _scan(self, cursor, options):
+        # A cursor stands for the last key returned, so keys deleted between pages skip nothing
+        after = self._cursors.pop(cursor, None)
+        pattern = options.get(b'MATCH', b'*').decode()
+        count = int(options.get(b'COUNT', 10))
+        keys = sorted(
+            key for key in self.data
+            if fnmatch.fnmatchcase(key.decode(), pattern) and (after is None or key > after)
+        )
+        page, next_cursor = keys[:count], 0
+        if len(keys) > count:
+            next_cursor = len(self._cursors) + 1
+            self._cursors[next_cursor] = page[-1]
+        return b'*2\r\n' + bulk(str(next_cursor).encode()) + b'*%d\r\n' % len(page) + b''.join(bulk(key) for key in page)
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                command = caching._read_reply(self.rfile)
+            except caching.RespError:
+                return
+            self.wfile.write(self.server.reply(command))
+
+
+def bulk(data):
+    if data is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+@pytest.fixture
+def server():
+    server = RespStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    client = RespClient(port=server.port)
+    yield client
+    client.close()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# REDIS CACHE
+
+def test_redis_round_trip(server, client):
+    cache = RedisCache(client, prefix='test:', ttl=60)
+    value = {'data': [{'x': [1, 2], 'y': [3.5, None]}], 'layout': {'title': 'Europe'}}
+
+    assert cache.get('figure', MISSING) is MISSING
+    cache.put('figure', value)
+    assert cache.get('figure') == value
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert server.expiry[b'test:figure'] == 60
+
+    # A ttl below a second still expires, and no ttl means no EX
+    cache.put('short', 'text', ttl=0.2)
+    assert server.expiry[b'test:short'] == 1
+    RedisCache(client, prefix='test:').put('forever', 'text')
+    assert b'test:forever' not in server.expiry
+
+
+def test_redis_clear_only_removes_prefixed_keys(server, client):
+    cache = RedisCache(client, prefix='test:')
+    # More keys than one SCAN page holds
+    for i in range(1200):
+        cache.put('key{}'.format(i), i)
+    client.execute('SET', 'other:key', 'kept')
+
+    cache.clear()
+
+    assert server.data == {b'other:key': b'kept'}
+    assert server.commands.count('SCAN') > 1
+    assert cache.get('key0', MISSING) is MISSING
+
+
+def test_redis_unreachable_is_a_miss():
+    cache = RedisCache(RespClient(port=closed_port(), timeout=0.5))
+
+    cache.put('key', 'value')
+    assert cache.get('key', MISSING) is MISSING
+    assert cache.misses == 1
+
+
+def test_redis_error_reply_is_a_miss_until_it_recovers(server, client):
+    cache = RedisCache(client)
+    cache.put('key', 'value')
+
+    server.fail = True
+    assert cache.get('key', MISSING) is MISSING
+    cache.put('key', 'new value')
+
+    # The client dropped its connection on the error and opens a new one
+    server.fail = False
+    assert cache.get('key') == 'value'
+
+
+def test_cached_callback_runs_the_callback_when_the_backend_fails(server, client):
+    server.fail = True
+    calls = []
+
+    @cached_callback(RedisCache(client), 'callback', lambda: 'v1')
+    def callback(value):
+        calls.append(value)
+        return value * 2
+
+    assert callback(2) == 4
+    assert callback(2) == 4
+    assert calls == [2, 2]
+
+
+# DISK CACHE
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put('key', {'a': [1, 2]})
+
+    assert cache.get('key') == {'a': [1, 2]}
+    assert DiskCache(str(tmp_path)).get('key') == {'a': [1, 2]}
+    assert cache.get('other', MISSING) is MISSING
+
+
+def test_disk_cache_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caching.time, 'time', lambda: now[0])
+    cache = DiskCache(str(tmp_path), ttl=60)
+    cache.put('key', 'value')
+    cache.put('forever', 'value', ttl=0)
+
+    now[0] += 59
+    assert cache.get('key') == 'value'
+
+    now[0] += 2
+    assert cache.get('key', MISSING) is MISSING
+    assert cache.get('forever') == 'value'
+    # The expired entry's file is removed on the miss
+    assert len(os.listdir(str(tmp_path))) == 1
+
+
+def test_disk_cache_trim_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1)
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, 'x' * 100)
+        os.utime(cache._path(key), (i, i))
+    entry_size = os.path.getsize(cache._path('a'))
+    cache.max_bytes = 2 * entry_size
+
+    # Reading 'a' makes it the most recently used, so 'b' goes first
+    assert cache.get('a') is not None
+    cache.trim()
+
+    assert cache.get('b', MISSING) is MISSING
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+
+
+def test_disk_cache_trims_every_few_writes(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.SIZE_CHECK_EVERY = 4
+    for i in range(3):
+        cache.put('key{}'.format(i), 'x' * 100)
+    cache.max_bytes = 0
+
+    # The third write left the directory as it was, the fourth trims it
+    assert len(os.listdir(str(tmp_path))) == 3
+    cache.put('key3', 'x' * 100)
+    assert os.listdir(str(tmp_path)) == []
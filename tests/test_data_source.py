@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+import data_source
+from dashboard_config import load_config
+from dataset import build_dataset
+
+
+def memory_mapped(values):
+    while values is not None and not isinstance(values, np.memmap):
+        values = values.base
+    return values is not None
+
+
+def test_snapshot_is_reused_and_memory_mapped(vaccinations_csv, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = data_source.load_snapshot(vaccinations_csv, cache_dir=cache_dir)
+    second = data_source.load_snapshot(vaccinations_csv, cache_dir=cache_dir)
+
+    assert second.version == first.version
+    frame = second.frame
+    assert list(frame.columns) == data_source.COLUMNS
+    assert frame['country'].dtype == 'category'
+    assert frame['date'].dtype == 'datetime64[ns]'
+    for col in ('people_fully_vaccinated', 'date'):
+        assert memory_mapped(frame[col].to_numpy())
+    assert memory_mapped(frame['country'].values.codes)
+
+    # Parsed from the CSV and loaded from the snapshot, the columns hold the same values
+    for col in ('country', 'iso_code'):
+        assert frame[col].astype(str).tolist() == first.frame[col].astype(str).tolist()
+    np.testing.assert_array_equal(frame['people_fully_vaccinated'], first.frame['people_fully_vaccinated'])
+
+
+def test_dataset_builds_from_a_reused_snapshot(vaccinations_csv, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    config = load_config()
+    datasets = [
+        build_dataset(data_source.load_snapshot(vaccinations_csv, cache_dir=cache_dir), config)
+        for _ in range(2)
+    ]
+
+    assert datasets[1].last_date == datasets[0].last_date
+    assert datasets[1].df_pivot.equals(datasets[0].df_pivot)
+    np.testing.assert_array_equal(datasets[1].totals.totals, datasets[0].totals.totals)
+
+
+def test_refresh_removes_the_previous_snapshot(vaccinations_csv, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = data_source.load_snapshot(vaccinations_csv, cache_dir=cache_dir)
+    with open(vaccinations_csv, 'a') as fh:
+        fh.write('France,FRA,2021-05-01,\n')
+    second = data_source.load_snapshot(vaccinations_csv, cache_dir=cache_dir, refresh=True)
+
+    assert second.version != first.version
+    snapshots = [name for name in os.listdir(cache_dir) if name != data_source.MANIFEST]
+    assert snapshots == [second.version]
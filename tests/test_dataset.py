@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import series_index
+from conftest import vaccination_rows
+from dashboard_config import load_config
+from data_source import Snapshot
+from dataset import (
+    build_dataset,
+    compact,
+    stream_dataset,
+)
+
+# Rows up to this date are the initial build, the rest are appended
+SPLIT_DATE = '2021-03-31'
+
+
+def build(frame, version='base'):
+    return build_dataset(Snapshot(frame, version), load_config())
+
+
+def split(rows, date=SPLIT_DATE):
+    return rows.loc[rows['date'] <= date], rows.loc[rows['date'] > date]
+
+
+def late_starter_rows():
+    # Nigeria only starts reporting after the initial build
+    rows = vaccination_rows()
+    return rows.loc[(rows['country'] != 'Nigeria') | (rows['date'] > '2021-02-15')].reset_index(drop=True)
+
+
+def append_in_pieces(rows, split_date, days_per_piece):
+    prefix, rest = split(rows, split_date)
+    dataset = build(prefix)
+    days = sorted(rest['date'].unique())
+    for i in range(0, len(days), days_per_piece):
+        dataset.append(rest.loc[rest['date'].isin(days[i:i + days_per_piece])])
+    return dataset
+
+
+def sorted_pivot(df_pivot, dates):
+    df_pivot = df_pivot.assign(country=df_pivot['country'].astype(str), iso_code=df_pivot['iso_code'].astype(str))
+    df_pivot = df_pivot.sort_values(['country']).reset_index(drop=True)
+    return df_pivot[['iso_code', 'country']], df_pivot[dates].to_numpy(dtype='float64', na_value=np.nan)
+
+
+def assert_grid_matches(dataset, expected):
+    dates = expected.config.dates
+    keys, values = sorted_pivot(dataset.df_pivot, dates)
+    expected_keys, expected_values = sorted_pivot(expected.df_pivot, dates)
+    pd.testing.assert_frame_equal(keys, expected_keys)
+    np.testing.assert_array_equal(values, expected_values)
+
+    assert dataset.totals.continents == expected.totals.continents
+    assert dataset.totals.dates == expected.totals.dates
+    np.testing.assert_array_equal(dataset.totals.totals, expected.totals.totals)
+
+    columns = ['country', 'date', 'people_fully_vaccinated']
+    choropleth = dataset.df_choropleth.sort_values(columns[:2]).reset_index(drop=True)[columns]
+    expected_choropleth = expected.df_choropleth.sort_values(columns[:2]).reset_index(drop=True)[columns]
+    pd.testing.assert_frame_equal(choropleth, expected_choropleth)
+
+    assert dataset.last_date == expected.last_date
+    pd.testing.assert_series_equal(
+        dataset.last_values.sort_index(), expected.last_values.sort_index(), check_names=False,
+    )
+
+
+def assert_daily_matches(dataset, expected):
+    assert dataset.series.countries == expected.series.countries
+    assert dataset.series.iso_codes == expected.series.iso_codes
+    for country in expected.series.countries:
+        dates, values = dataset.series.series(country)
+        expected_dates, expected_values = expected.series.series(country)
+        np.testing.assert_array_equal(dates, expected_dates)
+        np.testing.assert_array_equal(values, expected_values)
+
+    assert dataset.daily_totals.dates == expected.daily_totals.dates
+    np.testing.assert_array_equal(dataset.daily_totals.totals, expected.daily_totals.totals)
+
+    cube, expected_cube = dataset.cube, expected.cube
+    assert (cube.countries, cube.iso_codes, cube.regions) == (expected_cube.countries, expected_cube.iso_codes,
+                                                              expected_cube.regions)
+    assert cube.days == expected_cube.days
+    np.testing.assert_allclose(cube.cube, expected_cube.cube, rtol=1e-9, equal_nan=True)
+
+
+# INCREMENTAL APPEND
+
+@pytest.mark.parametrize('days_per_piece', [1, 10])
+@pytest.mark.parametrize('make_rows', [vaccination_rows, late_starter_rows])
+def test_append_in_pieces_matches_a_full_build(make_rows, days_per_piece):
+    rows = make_rows()
+    expected = build(rows)
+    dataset = append_in_pieces(rows, '2021-01-20', days_per_piece)
+
+    assert_grid_matches(dataset, expected)
+    assert_daily_matches(dataset, expected)
+    # A day at a time appends more blocks than are kept, so they have been merged along the way
+    assert len(dataset.series.blocks) <= series_index.MAX_BLOCKS
+
+
+def test_append_of_old_rows_changes_nothing():
+    prefix, rest = split(vaccination_rows())
+    dataset = build(prefix)
+    version = dataset.version
+
+    assert dataset.append(prefix) == set()
+    assert dataset.version == version
+
+
+def test_merged_blocks_match_one_block_of_all_rows():
+    rows = compact(vaccination_rows())
+    pieces = np.array_split(np.sort(rows['date'].unique()), 5)
+    blocks = [series_index.block_from_frame(rows.loc[rows['date'].isin(piece)]) for piece in pieces]
+    merged = series_index.CountrySeries([series_index.merge_blocks(blocks)])
+    expected = series_index.CountrySeries.from_frame(rows)
+
+    assert merged.countries == expected.countries
+    assert merged.iso_codes == expected.iso_codes
+    for country in expected.countries:
+        for part, expected_part in zip(merged.series(country), expected.series(country)):
+            np.testing.assert_array_equal(part, expected_part)
+    for part, expected_part in zip(merged.daily_matrix(), expected.daily_matrix()):
+        np.testing.assert_array_equal(part, expected_part)
+
+
+def test_incremental_version_identifies_the_appended_rows():
+    prefix, rest = split(vaccination_rows())
+    first, second, other = build(prefix), build(prefix), build(prefix)
+
+    first.append(rest)
+    second.append(rest)
+    other.append(rest.loc[rest['country'] != 'France'])
+
+    assert first.version.startswith('base+')
+    assert second.version == first.version
+    assert other.version != first.version
+
+
+# CHUNKED INGEST
+
+@pytest.mark.parametrize('chunksize', [7, 37, 100000])
+def test_chunked_ingest_matches_a_full_build(vaccinations_csv, chunksize):
+    expected = build(pd.read_csv(vaccinations_csv))
+    dataset = stream_dataset(vaccinations_csv, expected.config, chunksize)
+
+    assert dataset.series is None
+    assert_grid_matches(dataset, expected)
+
+
+def test_chunked_ingest_skips_a_known_version(vaccinations_csv):
+    config = load_config()
+    dataset = stream_dataset(vaccinations_csv, config, 100)
+
+    assert stream_dataset(vaccinations_csv, config, 100, known_version=dataset.version) is None
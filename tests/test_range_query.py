@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from aggregates import ContinentAggregates
+from range_query import RangeQueries
+
+GRID_DATES = ['2021-01-01', '2021-01-15', '2021-02-01', '2021-02-15']
+DAILY_DATES = ['2021-01-01', '2021-01-02', '2021-01-03', '2021-01-04', '2021-01-05']
+
+
+def queries(dates):
+    values = np.arange(1, 2 * len(dates) + 1, dtype='float64').reshape(2, len(dates)) ** 2
+    return RangeQueries(ContinentAggregates(['Africa', 'Europe'], dates, values))
+
+
+@pytest.fixture(params=[GRID_DATES, DAILY_DATES], ids=['grid', 'daily'])
+def dates(request):
+    return request.param
+
+
+def test_whole_range(dates):
+    result = queries(dates).query('Europe')
+
+    values = (np.arange(len(dates) + 1, 2 * len(dates) + 1) ** 2).astype('float64')
+    assert (result['start'], result['end'], result['points']) == (dates[0], dates[-1], len(dates))
+    assert result['start_value'] == values[0]
+    assert result['end_value'] == values[-1]
+    assert result['delta'] == values[-1] - values[0]
+    assert result['average'] == pytest.approx(values.mean())
+
+
+def test_range_beyond_the_data_is_clipped_to_it(dates):
+    rq = queries(dates)
+
+    assert rq.query('Africa', start='2020-06-01', end='2021-12-31') == rq.query('Africa')
+    assert rq.query('Africa', start='2020-06-01', end=dates[0])['points'] == 1
+    assert rq.query('Africa', start=dates[-1], end='2021-12-31')['points'] == 1
+
+
+def test_single_date(dates):
+    result = queries(dates).query('Africa', start=dates[1], end=dates[1])
+
+    assert (result['start'], result['end'], result['points']) == (dates[1], dates[1], 1)
+    assert result['delta'] == 0
+    assert result['average'] == result['start_value'] == 4
+
+
+@pytest.mark.parametrize('start, end', [
+    # Entirely before or after the data
+    ('2020-01-01', '2020-12-31'),
+    ('2022-01-01', '2022-12-31'),
+    # Start after end
+    ('2021-01-03', '2021-01-02'),
+])
+def test_empty_range(dates, start, end):
+    with pytest.raises(ValueError):
+        queries(dates).query('Europe', start=start, end=end)
+
+
+def test_range_between_grid_dates_is_empty():
+    rq = queries(GRID_DATES)
+
+    with pytest.raises(ValueError):
+        rq.query('Europe', start='2021-01-02', end='2021-01-14')
+    # Dates in between snap inwards, to the grid dates inside the range
+    result = rq.query('Europe', start='2021-01-02', end='2021-02-10')
+    assert (result['start'], result['end']) == ('2021-01-15', '2021-02-01')
+
+
+def test_unknown_region_and_no_dates():
+    with pytest.raises(ValueError):
+        queries(GRID_DATES).query('Asia')
+    with pytest.raises(ValueError):
+        RangeQueries(ContinentAggregates(['Europe'], [], np.empty((1, 0)))).query('Europe')